@@ -0,0 +1,136 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+"""Compares the addresser against the original hex digest implementation.
+
+Checks that both produce identical addresses over a random corpus, then
+times cold derivation (every id new) and warm derivation (ids repeating, as
+the processor and ledger sync see them).
+
+    python3 addressing/benchmarks/addresser_benchmark.py [--count N]
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import sys
+import timeit
+from uuid import uuid4
+
+if __name__ == '__main__':
+    # Run from a checkout, so find the package beside this directory
+    sys.path.insert(
+        0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from marketplace_addressing import addresser
+
+
+def _reference_hash(identifier):
+    return hashlib.sha512(identifier.encode()).hexdigest()
+
+
+def _reference_compress(address, start, stop):
+    return "%.2X".lower() % (int(address, base=16) % (stop - start) + start)
+
+
+def reference_asset_address(asset_id):
+    full_hash = _reference_hash(asset_id)
+    return addresser.NS + _reference_compress(
+        full_hash,
+        addresser.AssetSpace.START,
+        addresser.AssetSpace.STOP) + full_hash[:62]
+
+
+def reference_offer_account_address(offer_id, account):
+    offer_hash = _reference_hash(offer_id)
+    account_hash = _reference_hash(account)
+    return addresser.NS + '00' + offer_hash[:60] + \
+        _reference_compress(account_hash, 1, 256)
+
+
+def reference_transfer_address(transfer_id, account):
+    full_hash = _reference_hash(transfer_id)
+    account_hash = _reference_hash(account)
+    return addresser.NS + _reference_compress(
+        full_hash,
+        addresser.TransferSpace.START,
+        addresser.TransferSpace.STOP) + full_hash[:60] + \
+        _reference_compress(account_hash, 1, 256)
+
+
+def check_equivalence(ids):
+    for identifier, other in zip(ids, reversed(ids)):
+        pairs = [
+            (addresser.make_asset_address(identifier),
+             reference_asset_address(identifier)),
+            (addresser.make_offer_account_address(identifier, other),
+             reference_offer_account_address(identifier, other)),
+            (addresser.make_transfer_address(identifier, other),
+             reference_transfer_address(identifier, other)),
+        ]
+        for new, old in pairs:
+            if new != old:
+                raise AssertionError(
+                    'Address mismatch for {}: {} != {}'.format(
+                        identifier, new, old))
+
+
+def _clear_caches():
+    addresser.make_asset_address.cache_clear()
+
+
+def _run(func, ids):
+    for identifier in ids:
+        func(identifier)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=100000,
+                        help='Number of random identifiers to derive')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Timing repetitions; the best is reported')
+    opts = parser.parse_args()
+
+    ids = [uuid4().hex for _ in range(opts.count)]
+    check_equivalence(ids)
+    print('{} identifiers: addresses identical'.format(opts.count))
+
+    hot = [random.choice(ids[:1000]) for _ in range(opts.count)]
+
+    def best(func, corpus, clear):
+        def setup():
+            if clear:
+                _clear_caches()
+        return min(timeit.repeat(
+            lambda: (setup(), _run(func, corpus)),
+            number=1,
+            repeat=opts.repeat))
+
+    rows = [
+        ('cold, reference', best(reference_asset_address, ids, False)),
+        ('cold, addresser', best(addresser.make_asset_address, ids, True)),
+        ('warm, reference', best(reference_asset_address, hot, False)),
+        ('warm, addresser', best(addresser.make_asset_address, hot, True)),
+    ]
+    for label, seconds in rows:
+        print('{:<16} {:8.3f} s  {:8.2f} us/address'.format(
+            label, seconds, seconds / opts.count * 1e6))
+
+
+if __name__ == '__main__':
+    main()
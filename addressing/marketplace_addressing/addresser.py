@@ -14,6 +14,7 @@
 # -----------------------------------------------------------------------------
 
 import enum
+from functools import lru_cache
 import hashlib
 
 
@@ -66,65 +67,80 @@ class AddressSpace(enum.IntEnum):
     OTHER_FAMILY = 100
 
 
+# Upper bound on the identifiers remembered by each make_*_address function
+CACHE_SIZE = 16384
 
 
 def _hash(identifier):
-    return hashlib.sha512(identifier.encode()).hexdigest()
+    return hashlib.sha512(identifier.encode()).digest()
 
 
-def _compress(address, start, stop):
-    return "%.2X".lower() % (int(address, base=16) % (stop - start) + start)
+def _compress(digest, start, stop):
+    """Maps a SHA-512 digest onto a two hex character infix in [start, stop).
 
+    int.from_bytes over the raw digest is the same integer as parsing its
+    128 character hex form, without building or scanning the hex string.
+    """
+    return '{:02x}'.format(
+        int.from_bytes(digest, 'big') % (stop - start) + start)
 
+
+@lru_cache(maxsize=CACHE_SIZE)
 def make_offer_account_address(offer_id, account):
     offer_hash = _hash(offer_id)
     account_hash = _hash(account)
 
-    return NS + '00' + offer_hash[:60] + _compress(account_hash, 1, 256)
+    return NS + '00' + offer_hash[:30].hex() + _compress(account_hash, 1, 256)
 
 
+@lru_cache(maxsize=CACHE_SIZE)
 def make_offer_history_address(offer_id):
     offer_hash = _hash(offer_id)
 
-    return NS + '00' + offer_hash[:60] + '00'
+    return NS + '00' + offer_hash[:30].hex() + '00'
 
 
+@lru_cache(maxsize=CACHE_SIZE)
 def make_resource_address(resource_id):
     full_hash = _hash(resource_id)
 
     return NS + _compress(
         full_hash,
         ResourceSpace.START,
-        ResourceSpace.STOP) + full_hash[:62]
+        ResourceSpace.STOP) + full_hash[:31].hex()
 
 
+@lru_cache(maxsize=CACHE_SIZE)
 def make_asset_address(asset_id):
     full_hash = _hash(asset_id)
 
     return NS + _compress(
         full_hash,
         AssetSpace.START,
-        AssetSpace.STOP) + full_hash[:62]
+        AssetSpace.STOP) + full_hash[:31].hex()
 
 
+@lru_cache(maxsize=CACHE_SIZE)
 def make_account_address(account_id):
     full_hash = _hash(account_id)
 
     return NS + _compress(
         full_hash,
         AccountSpace.START,
-        AccountSpace.STOP) + full_hash[:62]
+        AccountSpace.STOP) + full_hash[:31].hex()
 
 
+@lru_cache(maxsize=CACHE_SIZE)
 def make_offer_address(offer_id):
     full_hash = _hash(offer_id)
 
     return NS + _compress(
         full_hash,
         OfferSpace.START,
-        OfferSpace.STOP) + full_hash[:62]
+        OfferSpace.STOP) + full_hash[:31].hex()
 
 
+@lru_cache(maxsize=CACHE_SIZE)
 def make_transfer_address(transfer_id, account):
     full_hash = _hash(transfer_id)
     account_hash = _hash(account)
@@ -132,20 +148,15 @@ def make_transfer_address(transfer_id, account):
     return NS + _compress(
         full_hash,
         TransferSpace.START,
-        TransferSpace.STOP) + full_hash[:60] + _compress(account_hash, 1, 256)
+        TransferSpace.STOP) + full_hash[:30].hex() + \
+        _compress(account_hash, 1, 256)
 
 
 def _contains(num, space):
     return space.START <= num < space.STOP
 
 
-def address_is(address):
-
-    if address[:len(NS)] != NS:
-        return AddressSpace.OTHER_FAMILY
-
-    infix = int(address[6:8], 16)
-
+def _space_of_infix(infix):
     if _contains(infix, OfferHistorySpace):
         result = AddressSpace.OFFER_HISTORY
 
@@ -168,3 +179,89 @@ def address_is(address):
         result = AddressSpace.OTHER_FAMILY
 
     return result
+
+
+# The AddressSpace of every possible two hex character infix
+_INFIX_SPACES = tuple(_space_of_infix(infix) for infix in range(256))
+
+
+def address_is(address):
+
+    if address[:len(NS)] != NS:
+        return AddressSpace.OTHER_FAMILY
+
+    return _INFIX_SPACES[int(address[6:8], 16)]
+
+
+def addresses_are(addresses):
+    """Classifies many addresses at once.
+
+    Args:
+        addresses (iterable of str): State addresses.
+
+    Returns:
+        list of AddressSpace: The space of each address, in order.
+    """
+
+    ns_len = len(NS)
+    spaces = _INFIX_SPACES
+    other = AddressSpace.OTHER_FAMILY
+    return [spaces[int(address[6:8], 16)] if address[:ns_len] == NS
+            else other
+            for address in addresses]
+
+
+_MAKERS = {
+    AddressSpace.RESOURCE: make_resource_address,
+    AddressSpace.ASSET: make_asset_address,
+    AddressSpace.ACCOUNT: make_account_address,
+    AddressSpace.OFFER: make_offer_address,
+    AddressSpace.OFFER_HISTORY: make_offer_history_address,
+    AddressSpace.TRANSFER: make_transfer_address,
+}
+
+
+def make_addresses(kind, ids):
+    """Derives the addresses of many ids of one kind.
+
+    The per-id caches are bypassed, so that deriving a large batch does not
+    evict the ids looked up repeatedly elsewhere. Repeated ids within the
+    batch are hashed once.
+
+    Args:
+        kind (AddressSpace): The kind of the ids. For TRANSFER each id is a
+            (transfer_id, account) pair. For OFFER_HISTORY each id is an
+            offer id, or an (offer_id, account) pair for the offer account
+            address.
+        ids (iterable): The ids.
+
+    Returns:
+        list of str: The address of each id, in order.
+
+    Raises:
+        ValueError: kind has no addresses.
+    """
+
+    try:
+        make = _MAKERS[kind].__wrapped__
+    except KeyError:
+        raise ValueError('Cannot make addresses of kind {}'.format(kind))
+
+    if kind == AddressSpace.OFFER_HISTORY:
+        make_pair = make_offer_account_address.__wrapped__
+    else:
+        make_pair = make
+
+    derived = {}
+    result = []
+    for identifier in ids:
+        try:
+            address = derived[identifier]
+        except KeyError:
+            if isinstance(identifier, tuple):
+                address = make_pair(*identifier)
+            else:
+                address = make(identifier)
+            derived[identifier] = address
+        result.append(address)
+    return result
@@ -13,6 +13,7 @@
 # limitations under the License.
 # -----------------------------------------------------------------------------
 
+import hashlib
 import unittest
 from uuid import uuid4
 
@@ -63,4 +64,77 @@ class AddresserTest(unittest.TestCase):
             uuid4().hex,
             uuid4().hex)
 
-        self.assertEqual(len(offer_history_address), 70, "The address is valid")
+        self.assertEqual(len(offer_history_address), 70,
+                         "The address is valid")
+
+    def test_addresses_match_hex_digest_derivation(self):
+        for _ in range(1000):
+            identifier = uuid4().hex
+            account = uuid4().hex
+            full_hash = hashlib.sha512(identifier.encode()).hexdigest()
+            account_hash = hashlib.sha512(account.encode()).hexdigest()
+
+            self.assertEqual(
+                addresser.make_offer_address(identifier),
+                addresser.NS + _hex_compress(
+                    full_hash,
+                    addresser.OfferSpace.START,
+                    addresser.OfferSpace.STOP) + full_hash[:62],
+                "The offer address is unchanged.")
+
+            self.assertEqual(
+                addresser.make_offer_account_address(identifier, account),
+                addresser.NS + '00' + full_hash[:60] +
+                _hex_compress(account_hash, 1, 256),
+                "The offer account address is unchanged.")
+
+    def test_memoized_address(self):
+        identifier = uuid4().hex
+
+        self.assertEqual(addresser.make_asset_address(identifier),
+                         addresser.make_asset_address(identifier),
+                         "Repeated lookups return the same address.")
+
+    def test_make_addresses(self):
+        ids = [uuid4().hex for _ in range(100)]
+        ids.append(ids[0])
+
+        self.assertEqual(
+            addresser.make_addresses(addresser.AddressSpace.ASSET, ids),
+            [addresser.make_asset_address(i) for i in ids],
+            "The bulk addresses match the single addresses.")
+
+        pairs = [(i, uuid4().hex) for i in ids]
+        self.assertEqual(
+            addresser.make_addresses(addresser.AddressSpace.TRANSFER, pairs),
+            [addresser.make_transfer_address(*p) for p in pairs],
+            "The bulk transfer addresses match the single addresses.")
+
+        with self.assertRaises(ValueError):
+            addresser.make_addresses(addresser.AddressSpace.OTHER_FAMILY, ids)
+
+    def test_addresses_are(self):
+        space = addresser.AddressSpace
+        for _ in range(100):
+            addresses = [
+                addresser.make_resource_address(uuid4().hex),
+                addresser.make_asset_address(uuid4().hex),
+                addresser.make_account_address(uuid4().hex),
+                addresser.make_offer_address(uuid4().hex),
+                addresser.make_offer_history_address(uuid4().hex),
+                addresser.make_offer_account_address(uuid4().hex,
+                                                     uuid4().hex),
+                addresser.make_transfer_address(uuid4().hex, uuid4().hex),
+                'ffffff' + '0' * 64
+            ]
+
+            self.assertEqual(
+                addresser.addresses_are(addresses),
+                [space.RESOURCE, space.ASSET, space.ACCOUNT, space.OFFER,
+                 space.OFFER_HISTORY, space.OFFER_HISTORY, space.TRANSFER,
+                 space.OTHER_FAMILY],
+                "Each address is identified by the space it was made in.")
+
+
+def _hex_compress(address, start, stop):
+    return "%.2X".lower() % (int(address, base=16) % (stop - start) + start)
@@ -0,0 +1,157 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+"""Compares the ledger sync's compiled decoder against the original
+descriptor walking decoder.
+
+Builds Offer and Account containers shaped like those on a busy marketplace,
+checks that both decoders produce the same dicts, then times each. Requires
+the protobuf classes generated by bin/market-protogen.
+
+    python3 ledger_sync/benchmarks/decoding_benchmark.py [--count N]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+from uuid import uuid4
+
+if __name__ == '__main__':
+    # Run from a checkout, so find the packages in the top directory
+    TOP_DIR = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    sys.path.insert(0, os.path.join(TOP_DIR, 'ledger_sync'))
+    sys.path.insert(0, os.path.join(TOP_DIR, 'addressing'))
+
+# pylint: disable=wrong-import-position
+from marketplace_addressing import addresser
+from marketplace_ledger_sync.deltas import decoding
+from marketplace_ledger_sync.protobuf import account_pb2
+from marketplace_ledger_sync.protobuf import offer_pb2
+from marketplace_ledger_sync.protobuf import rule_pb2
+
+
+def reference_proto_to_dict(proto):
+    result = {}
+
+    for field in proto.DESCRIPTOR.fields:
+        key = field.name
+        value = getattr(proto, key)
+
+        if field.type == field.TYPE_MESSAGE:
+            if field.label == field.LABEL_REPEATED:
+                result[key] = [reference_proto_to_dict(p) for p in value]
+            else:
+                result[key] = reference_proto_to_dict(value)
+
+        elif field.type == field.TYPE_ENUM:
+            number = int(value)
+            name = field.enum_type.values_by_number.get(number).name
+            result[key] = name
+
+        elif field.label == field.LABEL_REPEATED:
+            result[key] = list(value)
+
+        else:
+            result[key] = value
+
+    return result
+
+
+def reference_data_to_dicts(address, data):
+    container = decoding.CONTAINERS[addresser.address_is(address)]()
+    container.ParseFromString(data)
+    return [reference_proto_to_dict(pb) for pb in container.entries]
+
+
+def make_offer_container(entries):
+    container = offer_pb2.OfferContainer()
+    for _ in range(entries):
+        container.entries.add(
+            id=uuid4().hex,
+            label='Apples for oranges',
+            description='A standing offer, open to anyone',
+            owners=[uuid4().hex],
+            source=uuid4().hex,
+            source_quantity=10,
+            target=uuid4().hex,
+            target_quantity=12,
+            rules=[
+                rule_pb2.Rule(type=rule_pb2.Rule.EXCHANGE_ONCE_PER_ACCOUNT),
+                rule_pb2.Rule(type=rule_pb2.Rule.REQUIRE_SOURCE_QUANTITIES,
+                              value=b'10')],
+            status=offer_pb2.Offer.OPEN)
+    return container.SerializeToString()
+
+
+def make_account_container(entries, assets):
+    container = account_pb2.AccountContainer()
+    for _ in range(entries):
+        container.entries.add(
+            public_key=uuid4().hex + uuid4().hex,
+            label='Trader',
+            description='An account holding many assets',
+            assets=[uuid4().hex for _ in range(assets)])
+    return container.SerializeToString()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=2000,
+                        help='Number of containers of each type to decode')
+    parser.add_argument('--entries', type=int, default=2,
+                        help='Entries per container')
+    parser.add_argument('--assets', type=int, default=20,
+                        help='Assets held by each account')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Timing repetitions; the best is reported')
+    opts = parser.parse_args()
+
+    corpora = [
+        ('offers', [(addresser.make_offer_address(uuid4().hex),
+                     make_offer_container(opts.entries))
+                    for _ in range(opts.count)]),
+        ('accounts', [(addresser.make_account_address(uuid4().hex),
+                       make_account_container(opts.entries, opts.assets))
+                      for _ in range(opts.count)])
+    ]
+
+    for name, corpus in corpora:
+        for address, data in corpus:
+            new = decoding.data_to_dicts(address, data)
+            old = reference_data_to_dicts(address, data)
+            if new != old:
+                raise AssertionError(
+                    'Decoded {} differ: {} != {}'.format(name, new, old))
+    print('{} containers of each type: decoded dicts identical'.format(
+        opts.count))
+
+    def best(func, corpus):
+        return min(timeit.repeat(
+            lambda: [func(adr, data) for adr, data in corpus],
+            number=1,
+            repeat=opts.repeat))
+
+    for name, corpus in corpora:
+        for label, func in [('reference', reference_data_to_dicts),
+                            ('compiled', decoding.data_to_dicts)]:
+            seconds = best(func, corpus)
+            print('{:<9} {:<10} {:8.3f} s  {:8.2f} us/container'.format(
+                name, label, seconds, seconds / opts.count * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import asyncio
+import logging
+import uuid
+
+import zmq
+import zmq.asyncio
+
+from sawtooth_sdk.protobuf.validator_pb2 import Message
+from sawtooth_sdk.protobuf.network_pb2 import PingResponse
+from sawtooth_sdk.protobuf.events_pb2 import EventList
+from sawtooth_sdk.protobuf.events_pb2 import EventSubscription
+from sawtooth_sdk.protobuf.events_pb2 import EventFilter
+from sawtooth_sdk.protobuf.client_event_pb2 import ClientEventsSubscribeRequest
+from sawtooth_sdk.protobuf.client_event_pb2\
+    import ClientEventsSubscribeResponse
+from sawtooth_sdk.protobuf.client_event_pb2\
+    import ClientEventsUnsubscribeRequest
+from sawtooth_sdk.protobuf.client_event_pb2\
+    import ClientEventsUnsubscribeResponse
+
+from marketplace_addressing.addresser import NS as NAMESPACE
+from marketplace_ledger_sync.subscriber import NULL_BLOCK_ID
+
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_DEPTH = 16
+REQUEST_TIMEOUT = 10
+
+
+class AsyncSubscriber(object):
+    """Subscribes to state delta events over a zmq.asyncio socket. Events are
+    received and decoded by one task, and applied in order by another, so
+    decoding the next block overlaps with writing the current one.
+
+    Args:
+        validator_url (str): The validator's component endpoint.
+        decode (function): Takes a list of events, returns a decoded block.
+        apply (coroutine function): Takes a decoded block and writes it.
+        depth (int): The most decoded blocks to hold waiting to be applied.
+    """
+    def __init__(self, validator_url, decode, apply, depth=DEFAULT_DEPTH):
+        self._url = validator_url
+        self._decode = decode
+        self._apply = apply
+        self._depth = depth
+        self._context = zmq.asyncio.Context()
+        self._socket = None
+        self._receiver = None
+        self._blocks = None
+        self._pending = {}
+        self._is_active = False
+
+    async def start(self, known_ids=None):
+        """Subscribes to state delta events, then applies the blocks they
+        describe until stopped.
+        """
+        if not known_ids:
+            known_ids = [NULL_BLOCK_ID]
+
+        if self._socket is None:
+            LOGGER.info('Connecting to validator: %s', self._url)
+            self._socket = self._context.socket(zmq.DEALER)
+            self._socket.connect(self._url)
+            self._blocks = asyncio.Queue(maxsize=self._depth)
+            self._receiver = asyncio.ensure_future(self._receive())
+
+        LOGGER.debug('Subscribing to state delta events')
+        block_sub = EventSubscription(event_type='sawtooth/block-commit')
+        delta_sub = EventSubscription(
+            event_type='sawtooth/state-delta',
+            filters=[EventFilter(
+                key='address',
+                match_string='^{}.*'.format(NAMESPACE),
+                filter_type=EventFilter.REGEX_ANY)])
+
+        request = ClientEventsSubscribeRequest(
+            last_known_block_ids=known_ids,
+            subscriptions=[block_sub, delta_sub])
+        reply = await self._request(
+            Message.CLIENT_EVENTS_SUBSCRIBE_REQUEST,
+            request.SerializeToString())
+        response = ClientEventsSubscribeResponse()
+        response.ParseFromString(reply.content)
+
+        # Forked all the way back to genesis, restart with no known_ids
+        if (response.status == ClientEventsSubscribeResponse.UNKNOWN_BLOCK
+                and known_ids != [NULL_BLOCK_ID]):
+            await self.start()
+            return
+
+        if response.status != ClientEventsSubscribeResponse.OK:
+            raise RuntimeError(
+                'Subscription failed with status: {}'.format(
+                    ClientEventsSubscribeResponse.Status.Name(
+                        response.status)))
+
+        self._is_active = True
+
+        LOGGER.debug('Successfully subscribed to state delta events')
+        while self._is_active:
+            block = await self._blocks.get()
+            if isinstance(block, Exception):
+                raise block
+            await self._apply(block)
+
+    async def stop(self):
+        """Stops the AsyncSubscriber, unsubscribing from state delta events
+        and closing the socket.
+        """
+        if self._socket is None:
+            return
+
+        if self._is_active:
+            self._is_active = False
+
+            LOGGER.debug('Unsubscribing from state delta events')
+            request = ClientEventsUnsubscribeRequest()
+            try:
+                reply = await self._request(
+                    Message.CLIENT_EVENTS_UNSUBSCRIBE_REQUEST,
+                    request.SerializeToString())
+                response = ClientEventsUnsubscribeResponse()
+                response.ParseFromString(reply.content)
+                status = response.status
+            except asyncio.TimeoutError:
+                status = None
+
+            if status != ClientEventsUnsubscribeResponse.OK:
+                LOGGER.warning(
+                    'Failed to unsubscribe with status: %s',
+                    ClientEventsUnsubscribeResponse.Status.Name(status)
+                    if status is not None else 'TIMEOUT')
+
+        self._receiver.cancel()
+        self._socket.close(linger=0)
+        self._socket = None
+
+    async def _request(self, message_type, content):
+        correlation_id = uuid.uuid4().hex
+        future = asyncio.get_event_loop().create_future()
+        self._pending[correlation_id] = future
+        try:
+            await self._send(message_type, content, correlation_id)
+            return await asyncio.wait_for(future, REQUEST_TIMEOUT)
+        finally:
+            self._pending.pop(correlation_id, None)
+
+    async def _send(self, message_type, content, correlation_id):
+        message = Message(
+            message_type=message_type,
+            correlation_id=correlation_id,
+            content=content)
+        await self._socket.send_multipart([message.SerializeToString()])
+
+    async def _receive(self):
+        try:
+            while True:
+                frames = await self._socket.recv_multipart()
+                message = Message()
+                message.ParseFromString(frames[-1])
+
+                if message.message_type == Message.PING_REQUEST:
+                    await self._send(
+                        Message.PING_RESPONSE,
+                        PingResponse().SerializeToString(),
+                        message.correlation_id)
+
+                elif message.message_type == Message.CLIENT_EVENTS:
+                    event_list = EventList()
+                    event_list.ParseFromString(message.content)
+                    await self._blocks.put(self._decode(event_list.events))
+
+                else:
+                    future = self._pending.get(message.correlation_id)
+                    if future is not None and not future.done():
+                        future.set_result(message)
+                    else:
+                        LOGGER.debug(
+                            'Dropping unexpected message of type %s',
+                            Message.MessageType.Name(message.message_type))
+
+        except asyncio.CancelledError:
+            raise
+
+        except Exception as err:  # pylint: disable=broad-except
+            LOGGER.exception(err)
+            await self._blocks.put(err)
@@ -0,0 +1,185 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import base64
+import json
+import logging
+
+from sawtooth_sdk.protobuf.validator_pb2 import Message
+from sawtooth_sdk.protobuf.block_pb2 import BlockHeader
+from sawtooth_sdk.protobuf.client_block_pb2 import ClientBlockListRequest
+from sawtooth_sdk.protobuf.client_block_pb2 import ClientBlockListResponse
+from sawtooth_sdk.protobuf.client_list_control_pb2 import ClientPagingControls
+from sawtooth_sdk.protobuf.client_state_pb2 import ClientStateListRequest
+from sawtooth_sdk.protobuf.client_state_pb2 import ClientStateListResponse
+
+from marketplace_addressing.addresser import address_is
+from marketplace_addressing.addresser import NS as NAMESPACE
+from marketplace_ledger_sync.deltas.decoding import CONTAINERS
+from marketplace_ledger_sync.deltas.decoding import data_to_dicts
+from marketplace_ledger_sync.deltas.updating import update_block
+
+
+LOGGER = logging.getLogger(__name__)
+
+PAGE_SIZE = 1000
+BATCH_SIZE = 1000
+
+# Blocks behind the head to snapshot, so a fork of the head cannot drop the
+# snapshot block and, with it, every resource loaded from it
+DEFAULT_DEPTH = 15
+
+
+class Snapshot(object):
+    """The marketplace state as of one block.
+
+    Args:
+        block_num (int): The number of the block the state is from.
+        block_id (str): The id of that block.
+        entries (iterable of tuple): (address, data) pairs, where data is
+            the serialized container at address.
+    """
+
+    def __init__(self, block_num, block_id, entries):
+        self.block_num = block_num
+        self.block_id = block_id
+        self.entries = entries
+
+
+def fetch_snapshot(stream, depth=DEFAULT_DEPTH):
+    """Reads the marketplace namespace at the block depth blocks behind the
+    validator's chain head, a page at a time.
+
+    Args:
+        stream (Stream): A Sawtooth SDK stream connected to the validator.
+        depth (int): How many blocks behind the head to read state from.
+
+    Returns:
+        Snapshot: The block and a lazy iterator over its state, or None if
+            the chain is not yet depth blocks long.
+    """
+    # Blocks are listed from the head back
+    request = ClientBlockListRequest(
+        paging=ClientPagingControls(limit=depth + 1))
+    response = ClientBlockListResponse()
+    response.ParseFromString(stream.send(
+        Message.CLIENT_BLOCK_LIST_REQUEST,
+        request.SerializeToString()).result().content)
+
+    if response.status != ClientBlockListResponse.OK or not response.blocks:
+        raise RuntimeError(
+            'Unable to fetch the chain head, status: {}'.format(
+                ClientBlockListResponse.Status.Name(response.status)))
+
+    if len(response.blocks) <= depth:
+        return None
+
+    block = response.blocks[depth]
+    header = BlockHeader()
+    header.ParseFromString(block.header)
+    LOGGER.info('Reading state at block %s: %s',
+                header.block_num, block.header_signature)
+
+    return Snapshot(
+        header.block_num,
+        block.header_signature,
+        _fetch_state(stream, header.state_root_hash))
+
+
+def _fetch_state(stream, state_root):
+    start = ''
+    while True:
+        request = ClientStateListRequest(
+            state_root=state_root,
+            address=NAMESPACE,
+            paging=ClientPagingControls(start=start, limit=PAGE_SIZE))
+        response = ClientStateListResponse()
+        response.ParseFromString(stream.send(
+            Message.CLIENT_STATE_LIST_REQUEST,
+            request.SerializeToString()).result().content)
+
+        if response.status == ClientStateListResponse.NO_RESOURCE:
+            return
+        if response.status != ClientStateListResponse.OK:
+            raise RuntimeError(
+                'Unable to list state, status: {}'.format(
+                    ClientStateListResponse.Status.Name(response.status)))
+
+        for entry in response.entries:
+            yield entry.address, entry.data
+
+        start = response.paging.next
+        if not start:
+            return
+
+
+def read_snapshot_file(path):
+    """Reads a snapshot exported to a JSON file, shaped like:
+
+        {"block_num": 1024, "block_id": "...",
+         "entries": [{"address": "...", "data": "<base64>"}, ...]}
+
+    Returns:
+        Snapshot: The block and state recorded in the file.
+    """
+    with open(path) as snapshot_file:
+        snapshot = json.load(snapshot_file)
+
+    return Snapshot(
+        int(snapshot['block_num']),
+        snapshot['block_id'],
+        ((e['address'], base64.b64decode(e['data']))
+         for e in snapshot['entries']))
+
+
+def load_snapshot(database, snapshot):
+    """Bulk loads a snapshot into an empty database as the first version of
+    every entity, then records its block so syncing resumes after it.
+
+    Returns:
+        int: The number of resources loaded.
+    """
+    loaded = 0
+    batch = []
+    for address, data in snapshot.entries:
+        if address_is(address) not in CONTAINERS:
+            continue
+        batch.extend((address, resource)
+                     for resource in data_to_dicts(address, data))
+        if len(batch) >= BATCH_SIZE:
+            loaded += _load_batch(database, snapshot.block_num, batch)
+            batch = []
+
+    if batch:
+        loaded += _load_batch(database, snapshot.block_num, batch)
+
+    database.insert('blocks', {
+        'block_num': snapshot.block_num,
+        'block_id': snapshot.block_id
+    })
+    LOGGER.info('Loaded %s resources as of block %s',
+                loaded, snapshot.block_num)
+    return loaded
+
+
+def _load_batch(database, block_num, batch):
+    inserted = 0
+    results = update_block(database, block_num, batch)
+    for table_name, table_results in results.items():
+        if table_results.get('errors'):
+            raise RuntimeError('Failed to load resources into {}: {}'.format(
+                table_name, table_results.get('first_error')))
+        inserted += table_results['inserted']
+    return inserted
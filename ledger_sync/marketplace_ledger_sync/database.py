@@ -14,27 +14,51 @@
 # -----------------------------------------------------------------------------
 
 import logging
+import sys
+import time
+
 import rethinkdb as re
 
+from marketplace_ledger_sync.deltas.updating import CURRENT_TABLE_NAMES
+from marketplace_ledger_sync.deltas.updating import TABLE_NAMES
+
 
 LOGGER = logging.getLogger(__name__)
 
+r = re.RethinkDB()
+
+# Seconds between reads of which tables and indexes exist
+SCHEMA_INTERVAL = 30.0
+
+# Tables holding a row per version of each resource, by block range
+VERSIONED_TABLES = sorted(TABLE_NAMES.values())
+
+# Tables holding only the current version of each resource, by versioned table
+CURRENT_TABLES = {
+    TABLE_NAMES[data_type]: CURRENT_TABLE_NAMES[data_type]
+    for data_type in TABLE_NAMES
+}
+
 
 class Database(object):
     """Simple object for managing a connection to a rethink database
     """
-    def __init__(self, host, port, name):
+    def __init__(self, host, port, name, schema_interval=SCHEMA_INTERVAL):
         self._host = host
         self._port = port
         self._name = name
         self._conn = None
+        self._tables = []
+        self._indexes = {}
+        self._schema_interval = schema_interval
+        self._schema_read_at = None
 
     def connect(self):
         """Initializes a connection to the database
         """
-        r = re.RethinkDB()
         LOGGER.debug('Connecting to database: %s:%s', self._host, self._port)
         self._conn = r.connect(host=self._host, port=self._port)
+        self.refresh_schema()
 
     def disconnect(self):
         """Closes the connection to the database
@@ -45,7 +69,6 @@ class Database(object):
     def fetch(self, table_name, primary_id):
         """Fetches a single resource by its primary id
         """
-        r = re.RethinkDB()
         return r.db(self._name).table(table_name)\
             .get(primary_id).run(self._conn)
 
@@ -53,51 +76,221 @@ class Database(object):
         """Inserts a document or a list of documents into the specified table
         in the database
         """
-        r = re.RethinkDB()
         return r.db(self._name).table(table_name).insert(docs).run(self._conn)
 
     def last_known_blocks(self, count):
         """Fetches the ids of the specified number of most recent blocks
         """
-        r = re.RethinkDB()
-        cursor = r.db(self._name).table('blocks')\
-            .order_by('block_num')\
+        block_ids = self._last_known_blocks_query(count).run(self._conn)
+        return list(reversed(block_ids))
+
+    def drop_fork(self, block_num):
+        """Deletes all resources from a particular block_num, and reopens the
+        versions those resources replaced
+        """
+        # Forks are rare, and must roll back any newly added current table
+        self.refresh_schema()
+        return _sum_results(
+            q.run(self._conn) for q in self._drop_fork_queries(block_num))
+
+    def refresh_schema(self):
+        """Re-reads which tables and ready indexes exist, so ones created by
+        market-setup-db while syncing are used from then on
+        """
+        self._load_schema(self._schema_query().run(self._conn))
+
+    def refresh_schema_if_stale(self):
+        """Re-reads the schema if it was last read over schema_interval
+        seconds ago
+        """
+        if self._schema_is_stale():
+            self.refresh_schema()
+
+    def has_table(self, table_name):
+        """Returns whether a table existed when the schema was last read
+        """
+        return table_name in self._tables
+
+    def has_index(self, table_name, index):
+        """Returns whether a table had a particular secondary index, fully
+        built, when the schema was last read
+        """
+        return index in self._indexes.get(table_name, ())
+
+    def _schema_query(self):
+        # Indexes are only listed once built, as queries on an index which
+        # is still building fail
+        database = r.db(self._name)
+        ready_indexes = database.table_list()\
+            .map(lambda name: [
+                name,
+                database.table(name).index_status()
+                .filter({'ready': True})
+                .get_field('index')
+                .coerce_to('array')])\
+            .coerce_to('object')
+        return r.expr({
+            'tables': database.table_list(),
+            'indexes': ready_indexes
+        })
+
+    def _load_schema(self, schema):
+        self._tables = schema['tables']
+        self._indexes = schema['indexes']
+        self._schema_read_at = time.monotonic()
+
+    def _schema_is_stale(self):
+        return (self._schema_read_at is None
+                or time.monotonic() - self._schema_read_at
+                >= self._schema_interval)
+
+    def _last_known_blocks_query(self, count):
+        return r.db(self._name).table('blocks')\
+            .order_by(index=r.desc('block_num'))\
+            .limit(count)\
             .get_field('block_id')\
-            .run(self._conn)
+            .coerce_to('array')
 
-        return list(cursor)[-count:]
+    def _drop_fork_queries(self, block_num):
+        """Each query can be rerun, and the fork's blocks are deleted last,
+        so if ledger sync stops partway through, the fork is still found and
+        dropped again when it restarts.
+        """
+        queries = []
+        for table_name in VERSIONED_TABLES:
+            current_table = CURRENT_TABLES[table_name]
+            if self.has_table(current_table):
+                queries.extend(self._restore_current_queries(
+                    table_name, current_table, block_num))
+            queries.append(
+                self._started_since(table_name, block_num).delete())
+            queries.append(
+                self._ended_since(table_name, block_num)
+                .update({'end_block_num': sys.maxsize}))
+        queries.append(
+            r.db(self._name).table('blocks')
+            .between(block_num, r.maxval)
+            .delete())
+        return queries
 
-    def drop_fork(self, block_num):
-        """Deletes all resources from a particular block_num
-        """
-        r = re.RethinkDB()
-        block_results = r.db(self._name).table('blocks')\
-            .filter(lambda rsc: rsc['block_num'].ge(block_num))\
-            .delete()\
-            .run(self._conn)
-
-        resource_results = r.db(self._name).table_list()\
-            .for_each(
-                lambda table_name: r.branch(
-                    r.eq(table_name, 'blocks'),
-                    [],
-                    r.eq(table_name, 'auth'),
-                    [],
-                    r.db(self._name).table(table_name)
-                    .filter(lambda rsc: rsc['start_block_num'].ge(block_num))
-                    .delete()))\
-            .run(self._conn)
-
-        return {k: v + resource_results[k] for k, v in block_results.items()}
+    def _restore_current_queries(self, table_name, current_table, block_num):
+        """Rolls a current table back to before block_num: drops resources
+        first written in the fork, then restores the versions the fork
+        replaced. Must run before those versions are reopened.
+        """
+        current = r.db(self._name).table(current_table)
+        return [
+            self._started_since(current_table, block_num).delete(),
+            current.insert(
+                self._ended_since(table_name, block_num)
+                .filter(r.row['start_block_num'] < block_num)
+                .without('delta_id')
+                .merge({'end_block_num': sys.maxsize}),
+                conflict='replace')
+        ]
+
+    def _started_since(self, table_name, block_num):
+        table = r.db(self._name).table(table_name)
+        if self.has_index(table_name, 'start_block_num'):
+            return table.between(block_num, r.maxval, index='start_block_num')
+        return table.filter(r.row['start_block_num'] >= block_num)
+
+    def _ended_since(self, table_name, block_num):
+        table = r.db(self._name).table(table_name)
+        if self.has_index(table_name, 'end_block_num'):
+            return table.between(block_num, sys.maxsize, index='end_block_num')
+        return table.filter((r.row['end_block_num'] >= block_num)
+                            & (r.row['end_block_num'] < sys.maxsize))
+
+    def get_table_exists(self, table_name):
+        """Returns a rethink query for whether a table exists, to be checked
+        within another query as it runs
+        """
+        return r.db(self._name).table_list().contains(table_name)
 
     def get_table(self, table_name):
         """Returns a rethink table query, which can be added to, and
         eventually run with run_query
         """
-        r = re.RethinkDB()
         return r.db(self._name).table(table_name)
 
     def run_query(self, query):
         """Takes a query based on get_table, and runs it.
         """
         return query.run(self._conn)
+
+
+class AsyncDatabase(Database):
+    """A Database whose methods are coroutines, run over a connection made by
+    the asyncio flavor of the rethink driver. Queries are built exactly as
+    they are for Database.
+    """
+    _r = re.RethinkDB()
+    _r.set_loop_type('asyncio')
+
+    async def connect(self):
+        """Initializes a connection to the database
+        """
+        LOGGER.debug('Connecting to database: %s:%s', self._host, self._port)
+        self._conn = await self._r.connect(host=self._host, port=self._port)
+        await self.refresh_schema()
+
+    async def disconnect(self):
+        """Closes the connection to the database
+        """
+        LOGGER.debug('Disconnecting from database')
+        await self._conn.close()
+
+    async def refresh_schema(self):
+        """Re-reads which tables and ready indexes exist, so ones created by
+        market-setup-db while syncing are used from then on
+        """
+        self._load_schema(await self._schema_query().run(self._conn))
+
+    async def refresh_schema_if_stale(self):
+        """Re-reads the schema if it was last read over schema_interval
+        seconds ago
+        """
+        if self._schema_is_stale():
+            await self.refresh_schema()
+
+    async def fetch(self, table_name, primary_id):
+        """Fetches a single resource by its primary id
+        """
+        return await super().fetch(table_name, primary_id)
+
+    async def insert(self, table_name, docs):
+        """Inserts a document or a list of documents into the specified table
+        in the database
+        """
+        return await super().insert(table_name, docs)
+
+    async def last_known_blocks(self, count):
+        """Fetches the ids of the specified number of most recent blocks
+        """
+        block_ids = await self._last_known_blocks_query(count).run(self._conn)
+        return list(reversed(block_ids))
+
+    async def drop_fork(self, block_num):
+        """Deletes all resources from a particular block_num, and reopens the
+        versions those resources replaced
+        """
+        await self.refresh_schema()
+        results = []
+        for query in self._drop_fork_queries(block_num):
+            results.append(await query.run(self._conn))
+        return _sum_results(results)
+
+    async def run_query(self, query):
+        """Takes a query based on get_table, and runs it.
+        """
+        return await query.run(self._conn)
+
+
+def _sum_results(results):
+    summed = {}
+    for result in results:
+        for key, value in result.items():
+            if isinstance(value, int):
+                summed[key] = summed.get(key, 0) + value
+    return summed
@@ -13,6 +13,8 @@
 # limitations under the License.
 # -----------------------------------------------------------------------------
 
+import hashlib
+
 from marketplace_addressing.addresser import address_is
 from marketplace_addressing.addresser import AddressSpace
 from marketplace_ledger_sync.protobuf.account_pb2 import AccountContainer
@@ -32,23 +34,52 @@ IGNORE = {
     AddressSpace.OFFER_HISTORY: True
 }
 
+# Field kinds in a decoding plan
+_SCALAR = 0
+_REPEATED_SCALAR = 1
+_MESSAGE = 2
+_REPEATED_MESSAGE = 3
+_ENUM = 4
+_REPEATED_ENUM = 5
+
+_PLANS = {}
+
 
 def data_to_dicts(address, data):
     """Deserializes a protobuf "container" binary based on its address. Returns
     a list of the decoded objects which were stored at that address.
     """
+    entries, plan = _parse_entries(address, data)
+    return [_apply_plan(pb, plan) for pb in entries]
+
+
+def data_to_entries(address, data):
+    """Like data_to_dicts, but pairs each decoded object with a digest of its
+    serialized entry, which changes only when the entry does.
+    """
+    entries, plan = _parse_entries(address, data)
+    return [(_apply_plan(pb, plan), _digest(pb)) for pb in entries]
+
+
+def _parse_entries(address, data):
     data_type = address_is(address)
 
     if IGNORE.get(data_type):
-        return []
+        return [], None
 
     try:
         container = CONTAINERS[data_type]
     except KeyError:
         raise TypeError('Unknown data type: {}'.format(data_type))
 
-    entries = _parse_proto(container, data).entries
-    return [_proto_to_dict(pb) for pb in entries]
+    container = _parse_proto(container, data)
+    plan = _get_plan(container.DESCRIPTOR.fields_by_name['entries']
+                     .message_type)
+    return container.entries, plan
+
+
+def _digest(proto):
+    return hashlib.sha256(proto.SerializeToString()).digest()[:16]
 
 
 def _parse_proto(proto_class, data):
@@ -58,24 +89,60 @@ def _parse_proto(proto_class, data):
 
 
 def _proto_to_dict(proto):
-    result = {}
+    return _apply_plan(proto, _get_plan(proto.DESCRIPTOR))
 
-    for field in proto.DESCRIPTOR.fields:
-        key = field.name
-        value = getattr(proto, key)
+
+def _get_plan(descriptor):
+    """Returns the decoding plan for a message type, compiling it on first
+    use. A plan is a list of (field name, kind, argument) tuples, where the
+    argument is the plan of a nested message type, or the names of an enum's
+    values by number.
+    """
+    try:
+        return _PLANS[descriptor.full_name]
+    except KeyError:
+        pass
+
+    # Registered before it is filled in, so recursive types terminate
+    plan = _PLANS[descriptor.full_name] = []
+
+    for field in descriptor.fields:
+        repeated = field.label == field.LABEL_REPEATED
 
         if field.type == field.TYPE_MESSAGE:
-            if field.label == field.LABEL_REPEATED:
-                result[key] = [_proto_to_dict(p) for p in value]
-            else:
-                result[key] = _proto_to_dict(value)
+            kind = _REPEATED_MESSAGE if repeated else _MESSAGE
+            argument = _get_plan(field.message_type)
 
         elif field.type == field.TYPE_ENUM:
-            number = int(value)
-            name = field.enum_type.values_by_number.get(number).name
-            result[key] = name
+            kind = _REPEATED_ENUM if repeated else _ENUM
+            argument = {v.number: v.name for v in field.enum_type.values}
 
         else:
+            kind = _REPEATED_SCALAR if repeated else _SCALAR
+            argument = None
+
+        plan.append((field.name, kind, argument))
+
+    return plan
+
+
+def _apply_plan(proto, plan):
+    result = {}
+
+    for key, kind, argument in plan:
+        value = getattr(proto, key)
+
+        if kind == _SCALAR:
             result[key] = value
+        elif kind == _REPEATED_SCALAR:
+            result[key] = list(value)
+        elif kind == _ENUM:
+            result[key] = argument[value]
+        elif kind == _MESSAGE:
+            result[key] = _apply_plan(value, argument)
+        elif kind == _REPEATED_MESSAGE:
+            result[key] = [_apply_plan(p, argument) for p in value]
+        else:
+            result[key] = [argument[v] for v in value]
 
     return result
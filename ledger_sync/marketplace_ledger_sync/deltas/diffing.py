@@ -0,0 +1,76 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+from collections import OrderedDict
+
+from marketplace_addressing.addresser import address_is
+from marketplace_ledger_sync.deltas.updating import SECONDARY_INDEXES
+
+
+DEFAULT_SIZE = 65536
+
+
+class EntryDigests(object):
+    """A bounded, least recently used map from (address, entry id) to the
+    digest of the entry last written for it. A state change carries every
+    entry in a container, so this is used to write new versions only for the
+    entries which actually changed.
+
+    Args:
+        size (int): The most entries to remember.
+    """
+
+    def __init__(self, size=DEFAULT_SIZE):
+        self._size = size
+        self._digests = OrderedDict()
+
+    def __len__(self):
+        return len(self._digests)
+
+    def changed(self, resources, digests):
+        """Filters out resources whose digest matches the one last written.
+
+        Args:
+            resources (list of tuple): (address, resource) pairs.
+            digests (list of bytes): The digest of each resource.
+
+        Returns:
+            tuple: The changed (address, resource) pairs, and the
+                (key, digest) pairs to remember once they are written.
+        """
+        changed = []
+        written = []
+        for (address, resource), digest in zip(resources, digests):
+            key = (address, resource[SECONDARY_INDEXES[address_is(address)]])
+            if self._digests.get(key) == digest:
+                self._digests.move_to_end(key)
+                continue
+            changed.append((address, resource))
+            written.append((key, digest))
+
+        return changed, written
+
+    def remember(self, written):
+        """Records the digests of entries which have been written.
+        """
+        for key, digest in written:
+            self._digests[key] = digest
+            self._digests.move_to_end(key)
+
+        while len(self._digests) > self._size:
+            self._digests.popitem(last=False)
+
+    def clear(self):
+        self._digests.clear()
@@ -13,38 +13,115 @@
 # limitations under the License.
 # -----------------------------------------------------------------------------
 
+from collections import namedtuple
 import re
 import logging
 
 from sawtooth_sdk.protobuf.transaction_receipt_pb2 import StateChangeList
 
 from marketplace_ledger_sync.deltas.decoding import data_to_dicts
-from marketplace_ledger_sync.deltas.updating import get_updater
+from marketplace_ledger_sync.deltas.decoding import data_to_entries
+from marketplace_ledger_sync.deltas.updating import update_block
+from marketplace_ledger_sync.deltas.updating import update_block_async
 from marketplace_addressing.addresser import NS as NAMESPACE
 
 
 NS_REGEX = re.compile('^{}'.format(NAMESPACE))
 LOGGER = logging.getLogger(__name__)
 
+BlockChanges = namedtuple(
+    'BlockChanges', ['block_num', 'block_id', 'resources', 'digests'])
 
-def get_events_handler(database):
+
+def get_events_handler(database, digests=None):
     """Returns a events handler with a reference to a specific Database object.
     The handler takes a list of events and updates the Database appropriately.
     """
-    return lambda events: _handle_events(database, events)
+    return lambda events: apply_block_changes(
+        database, decode_events(events, digests is not None), digests)
+
+
+def get_block_applier(database, digests=None):
+    """Returns a function which applies a decoded BlockChanges to a specific
+    Database object.
+    """
+    return lambda block: apply_block_changes(database, block, digests)
 
 
-def _handle_events(database, events):
+def decode_events(events, with_digests=True):
+    """Decodes a list of events into the block they commit and the resources
+    changed in it, without touching the database.
+
+    Args:
+        events (list of Event): The events for one block.
+        with_digests (bool): Whether to digest each resource's entry, which
+            is only needed to skip unchanged entries with an EntryDigests.
+
+    Returns:
+        BlockChanges: The block number and id, (address, resource) pairs for
+            every resource in a changed container, and the digest of each,
+            or None for the digests if with_digests is False.
+    """
     block_num, block_id = _parse_new_block(events)
+    changes = _parse_state_changes(events)
+    resources = []
+    if not with_digests:
+        for change in changes:
+            resources.extend((change.address, resource) for resource
+                             in data_to_dicts(change.address, change.value))
+        return BlockChanges(block_num, block_id, resources, None)
+
+    digests = []
+    for change in changes:
+        for resource, digest in data_to_entries(change.address, change.value):
+            resources.append((change.address, resource))
+            digests.append(digest)
+
+    return BlockChanges(block_num, block_id, resources, digests)
+
+
+def apply_block_changes(database, block, digests=None):
+    """Writes a decoded block to the database, first dropping any fork it
+    replaces. Blocks must be applied in the order they were received.
 
-    is_duplicate = _resolve_if_forked(database, block_num, block_id)
+    Args:
+        database (Database): The database to update.
+        block (BlockChanges): The decoded block.
+        digests (EntryDigests, optional): Digests of the entries already
+            written, used to skip rewriting entries which have not changed.
+    """
+    # Tables and indexes may have been added since the schema was read
+    database.refresh_schema_if_stale()
+    is_duplicate = _resolve_if_forked(
+        database, block.block_num, block.block_id, digests)
     if is_duplicate:
         return
 
-    changes = _parse_state_changes(events)
-    _apply_state_changes(database, changes, block_num)
+    resources, written = _filter_unchanged(block, digests)
+    results = update_block(database, block.block_num, resources)
+    _check_update_results(results, block.block_num, digests, written)
 
-    _insert_new_block(database, block_num, block_id)
+    _insert_new_block(database, block.block_num, block.block_id)
+
+
+async def apply_block_changes_async(database, block, digests=None):
+    """Like apply_block_changes, but for an AsyncDatabase.
+    """
+    await database.refresh_schema_if_stale()
+    old_block = await database.fetch('blocks', block.block_num)
+    if old_block is not None:
+        if old_block['block_id'] == block.block_id:
+            return  # this block is a duplicate
+        drop_results = await database.drop_fork(block.block_num)
+        _check_drop_results(drop_results, block.block_num, digests)
+
+    resources, written = _filter_unchanged(block, digests)
+    results = await update_block_async(database, block.block_num, resources)
+    _check_update_results(results, block.block_num, digests, written)
+
+    new_block = {'block_num': block.block_num, 'block_id': block.block_id}
+    block_results = await database.insert('blocks', new_block)
+    _check_block_results(block_results, block.block_num, block.block_id)
 
 
 def _parse_new_block(events):
@@ -73,33 +150,55 @@ def _parse_state_changes(events):
             if NS_REGEX.match(c.address)]
 
 
-def _resolve_if_forked(database, block_num, block_id):
+def _resolve_if_forked(database, block_num, block_id, digests=None):
     old_block = database.fetch('blocks', block_num)
     if old_block is not None:
         if old_block['block_id'] == block_id:
             return True  # this block is a duplicate
         drop_results = database.drop_fork(block_num)
-        if drop_results['deleted'] == 0:
-            LOGGER.warning(
-                'Failed to drop forked resources since block: %s',
-                block_num)
+        _check_drop_results(drop_results, block_num, digests)
     return False
 
 
-def _apply_state_changes(database, changes, block_num):
-    update = get_updater(database, block_num)
-    for change in changes:
-        resources = data_to_dicts(change.address, change.value)
-        for resource in resources:
-            update_results = update(change.address, resource)
-            if update_results['inserted'] == 0:
-                LOGGER.warning(
-                    'Failed to insert resource from address: %s',
-                    change.address)
+def _check_drop_results(drop_results, block_num, digests=None):
+    # Digests may describe entries from the dropped fork
+    if digests is not None:
+        digests.clear()
+
+    if drop_results['deleted'] == 0:
+        LOGGER.warning(
+            'Failed to drop forked resources since block: %s',
+            block_num)
+
+
+def _filter_unchanged(block, digests):
+    if digests is None or block.digests is None:
+        return block.resources, []
+    return digests.changed(block.resources, block.digests)
+
+
+def _check_update_results(results, block_num, digests=None, written=None):
+    failed = False
+    for table_name, update_results in results.items():
+        if update_results.get('errors') or update_results['inserted'] == 0:
+            failed = True
+            LOGGER.warning(
+                'Failed to insert resources into %s for block %s: %s',
+                table_name, block_num, update_results.get('first_error'))
+
+    if digests is not None:
+        if failed:
+            digests.clear()
+        else:
+            digests.remember(written)
 
 
 def _insert_new_block(database, block_num, block_id):
     new_block = {'block_num': block_num, 'block_id': block_id}
     block_results = database.insert('blocks', new_block)
+    _check_block_results(block_results, block_num, block_id)
+
+
+def _check_block_results(block_results, block_num, block_id):
     if block_results['inserted'] == 0:
         LOGGER.warning('Failed to insert block #%s: %s', block_num, block_id)
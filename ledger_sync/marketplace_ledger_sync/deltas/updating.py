@@ -13,6 +13,7 @@
 # limitations under the License.
 # -----------------------------------------------------------------------------
 
+from collections import defaultdict
 import sys
 
 from marketplace_addressing.addresser import address_is
@@ -33,6 +34,18 @@ SECONDARY_INDEXES = {
     AddressSpace.OFFER: 'id'
 }
 
+CURRENT_TABLE_NAMES = {
+    data_type: '{}_current'.format(table_name)
+    for data_type, table_name in TABLE_NAMES.items()
+}
+
+# Compound indexes of [secondary index, end_block_num], which find the current
+# version of a resource without scanning its history
+CURRENT_INDEXES = {
+    data_type: '{}_end_block_num'.format(index)
+    for data_type, index in SECONDARY_INDEXES.items()
+}
+
 
 def get_updater(database, block_num):
     """Returns an updater function, which can be used to update the database
@@ -60,3 +73,91 @@ def _update(database, block_num, address, resource):
         .merge(table_query.insert(resource).without('replaced'))
 
     return database.run_query(query)
+
+
+def update_block(database, block_num, resources):
+    """Writes every resource changed in a block, grouped by table. Each table
+    takes one query, which closes the current versions of all its changed
+    resources, inserts their new versions, and upserts them into the table's
+    current table, if there is one.
+
+    Args:
+        database (Database): The database to update.
+        block_num (int): The number of the block the changes are from.
+        resources (list of tuple): (address, resource) pairs, where resource
+            is a dict decoded from the state at address.
+
+    Returns:
+        dict: The query results, by table name.
+    """
+
+    queries = build_block_queries(database, block_num, resources)
+    return {name: database.run_query(q) for name, q in queries.items()}
+
+
+async def update_block_async(database, block_num, resources):
+    """Like update_block, but for an AsyncDatabase.
+    """
+
+    queries = build_block_queries(database, block_num, resources)
+    results = {}
+    for table_name, query in queries.items():
+        results[table_name] = await database.run_query(query)
+    return results
+
+
+def build_block_queries(database, block_num, resources):
+    """Builds the queries update_block runs, one per table changed.
+
+    Returns:
+        dict: Unrun queries, by table name.
+    """
+
+    docs_by_type = defaultdict(list)
+    for address, resource in resources:
+        data_type = address_is(address)
+        if data_type not in TABLE_NAMES:
+            raise TypeError('Unknown data type: {}'.format(data_type))
+
+        resource['start_block_num'] = block_num
+        resource['end_block_num'] = sys.maxsize
+        docs_by_type[data_type].append(resource)
+
+    queries = {}
+    for data_type, docs in docs_by_type.items():
+        table_query = database.get_table(TABLE_NAMES[data_type])
+        query = _get_current(database, table_query, data_type, docs)\
+            .update({'end_block_num': block_num})\
+            .merge(table_query.insert(docs).without('replaced'))
+
+        query = _upsert_current(
+            database, query, CURRENT_TABLE_NAMES[data_type], docs)
+        queries[TABLE_NAMES[data_type]] = query
+
+    return queries
+
+
+def _upsert_current(database, query, current_table, docs):
+    # Checked as the query runs, so a current table market-setup-db has just
+    # put in place is written from the very next block
+    upsert = database.get_table_exists(current_table).branch(
+        database.get_table(current_table).insert(docs, conflict='replace'),
+        {'errors': 0})
+    return query.do(lambda results: upsert.do(
+        lambda current: results.merge({
+            'errors': results['errors'].add(current['errors'])
+        })))
+
+
+def _get_current(database, table_query, data_type, docs):
+    secondary_index = SECONDARY_INDEXES[data_type]
+    current_index = CURRENT_INDEXES[data_type]
+    keys = [doc[secondary_index] for doc in docs]
+
+    if database.has_index(TABLE_NAMES[data_type], current_index):
+        return table_query.get_all(
+            *[[key, sys.maxsize] for key in keys], index=current_index)
+
+    return table_query\
+        .get_all(*keys, index=secondary_index)\
+        .filter({'end_block_num': sys.maxsize})
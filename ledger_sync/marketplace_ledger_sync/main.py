@@ -15,10 +15,25 @@
 
 import sys
 import argparse
+import asyncio
 import logging
 
+from sawtooth_sdk.messaging.stream import Stream
+
+from marketplace_ledger_sync.bootstrap import DEFAULT_DEPTH
+from marketplace_ledger_sync.bootstrap import fetch_snapshot
+from marketplace_ledger_sync.bootstrap import load_snapshot
+from marketplace_ledger_sync.bootstrap import read_snapshot_file
+from marketplace_ledger_sync.database import AsyncDatabase
 from marketplace_ledger_sync.database import Database
 from marketplace_ledger_sync.subscriber import Subscriber
+from marketplace_ledger_sync.async_subscriber import AsyncSubscriber
+from marketplace_ledger_sync.pipeline import EventPipeline
+from marketplace_ledger_sync.deltas.diffing import DEFAULT_SIZE
+from marketplace_ledger_sync.deltas.diffing import EntryDigests
+from marketplace_ledger_sync.deltas.handlers import apply_block_changes_async
+from marketplace_ledger_sync.deltas.handlers import decode_events
+from marketplace_ledger_sync.deltas.handlers import get_block_applier
 from marketplace_ledger_sync.deltas.handlers import get_events_handler
 
 
@@ -47,6 +62,34 @@ def parse_args(args):
     parser.add_argument('--db-name',
                         help='The name of the database to use',
                         default='marketplace')
+    parser.add_argument('--pipeline-depth',
+                        help='Blocks to buffer between receiving, decoding '
+                             'and applying events, 0 to apply inline',
+                        type=int,
+                        default=0)
+    parser.add_argument('--async',
+                        help='Use the asyncio subscriber and database driver',
+                        dest='use_async',
+                        action='store_true')
+    parser.add_argument('--diff-cache-size',
+                        help='Entries to remember digests of, to skip '
+                             'rewriting unchanged ones, 0 to disable',
+                        type=int,
+                        default=DEFAULT_SIZE)
+    parser.add_argument('--bootstrap',
+                        help='When the database is empty, load the current '
+                             'state from the validator instead of replaying '
+                             'every block',
+                        action='store_true')
+    parser.add_argument('--snapshot-file',
+                        help='When the database is empty, load the state '
+                             'exported to this file instead of replaying '
+                             'every block')
+    parser.add_argument('--bootstrap-depth',
+                        help='Blocks behind the chain head to read state '
+                             'from when bootstrapping',
+                        type=int,
+                        default=DEFAULT_DEPTH)
     return parser.parse_args(args)
 
 
@@ -61,18 +104,117 @@ def init_logger(level):
         logger.setLevel(logging.WARN)
 
 
+def _make_digests(opts):
+    if opts.diff_cache_size > 0:
+        return EntryDigests(opts.diff_cache_size)
+    return None
+
+
 def main():
+    opts = parse_args(sys.argv[1:])
+    init_logger(opts.verbose)
+
+    LOGGER.info('Starting Ledger Sync...')
+
+    if opts.bootstrap or opts.snapshot_file:
+        try:
+            _bootstrap(opts)
+        except KeyboardInterrupt:
+            sys.exit(0)
+        except Exception as err:  # pylint: disable=broad-except
+            LOGGER.exception(err)
+            sys.exit(1)
+
+    if opts.use_async:
+        _run_async(opts)
+    else:
+        _run(opts)
+
+
+def _bootstrap(opts):
+    database = Database(opts.db_host, opts.db_port, opts.db_name)
+    database.connect()
     try:
-        opts = parse_args(sys.argv[1:])
-        init_logger(opts.verbose)
+        if database.last_known_blocks(1):
+            LOGGER.info('Database already synced, skipping bootstrap')
+            return
+
+        if opts.snapshot_file:
+            LOGGER.info('Bootstrapping from: %s', opts.snapshot_file)
+            load_snapshot(database, read_snapshot_file(opts.snapshot_file))
+            return
+
+        LOGGER.info('Bootstrapping from validator: %s', opts.validator)
+        stream = Stream(opts.validator)
+        try:
+            stream.wait_for_ready()
+            snapshot = fetch_snapshot(stream, opts.bootstrap_depth)
+            if snapshot is None:
+                LOGGER.info('Chain is too short to bootstrap, replaying it')
+                return
+            load_snapshot(database, snapshot)
+        finally:
+            stream.close()
+
+    finally:
+        database.disconnect()
+
+
+def _run_async(opts):
+    loop = asyncio.get_event_loop()
+    try:
+        database = AsyncDatabase(opts.db_host, opts.db_port, opts.db_name)
+        loop.run_until_complete(database.connect())
+
+        digests = _make_digests(opts)
+        subscriber = AsyncSubscriber(
+            opts.validator,
+            lambda events: decode_events(events, digests is not None),
+            lambda block: apply_block_changes_async(database, block, digests),
+            depth=max(opts.pipeline_depth, 1))
+
+        known_blocks = loop.run_until_complete(
+            database.last_known_blocks(KNOWN_COUNT))
+        loop.run_until_complete(subscriber.start(known_blocks))
+
+    except KeyboardInterrupt:
+        sys.exit(0)
 
-        LOGGER.info('Starting Ledger Sync...')
+    except Exception as err:  # pylint: disable=broad-except
+        LOGGER.exception(err)
+        sys.exit(1)
 
+    finally:
+        try:
+            loop.run_until_complete(subscriber.stop())
+        except UnboundLocalError:
+            pass
+
+        try:
+            loop.run_until_complete(database.disconnect())
+        except UnboundLocalError:
+            pass
+
+        loop.close()
+        LOGGER.info('Ledger Sync shut down successfully')
+
+
+def _run(opts):
+    try:
         database = Database(opts.db_host, opts.db_port, opts.db_name)
         database.connect()
 
         subscriber = Subscriber(opts.validator)
-        subscriber.add_handler(get_events_handler(database))
+        digests = _make_digests(opts)
+        if opts.pipeline_depth > 0:
+            pipeline = EventPipeline(
+                lambda events: decode_events(events, digests is not None),
+                get_block_applier(database, digests),
+                depth=opts.pipeline_depth)
+            pipeline.start()
+            subscriber.set_pipeline(pipeline)
+        else:
+            subscriber.add_handler(get_events_handler(database, digests))
 
         known_blocks = database.last_known_blocks(KNOWN_COUNT)
         subscriber.start(known_blocks)
@@ -90,6 +232,11 @@ def main():
         except UnboundLocalError:
             pass
 
+        try:
+            pipeline.stop()
+        except UnboundLocalError:
+            pass
+
         try:
             database.disconnect()
         except UnboundLocalError:
@@ -0,0 +1,152 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import logging
+import queue
+import threading
+import time
+
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_DEPTH = 16
+REPORT_INTERVAL = 30.0
+
+_STOP = object()
+
+
+class EventPipeline(object):
+    """Decouples receiving events from the validator from writing them to the
+    database. Events put into the pipeline are decoded on one thread and
+    applied on another, each reading from a bounded FIFO queue, so blocks are
+    always applied in the order they were received. When the database falls
+    behind and the queues fill, put blocks until there is room again.
+
+    Args:
+        decode (function): Takes a list of events, returns a decoded block
+            with a block_num attribute. Must not touch the database.
+        apply (function): Takes a decoded block and writes it.
+        depth (int): The maximum number of blocks waiting in each stage.
+    """
+
+    def __init__(self, decode, apply, depth=DEFAULT_DEPTH,
+                 report_interval=REPORT_INTERVAL):
+        self._decode = decode
+        self._apply = apply
+        self._decode_queue = queue.Queue(maxsize=depth)
+        self._apply_queue = queue.Queue(maxsize=depth)
+        self._report_interval = report_interval
+        self._last_report = time.monotonic()
+        self._last_decoded = None
+        self._last_applied = None
+        self._error = None
+        self._threads = [
+            threading.Thread(target=self._run_decode, name='decode',
+                             daemon=True),
+            threading.Thread(target=self._run_apply, name='apply',
+                             daemon=True)
+        ]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def put(self, events):
+        """Queues a list of events for decoding, blocking while the pipeline
+        is full. Raises any error that stopped one of the stages.
+        """
+        self._check_error()
+        while True:
+            try:
+                self._decode_queue.put(events, timeout=1.0)
+                break
+            except queue.Full:
+                self._check_error()
+        self._maybe_report()
+
+    def stop(self, timeout=None):
+        """Waits for queued blocks to be applied, then stops the stages.
+        """
+        if not self._threads[0].is_alive():
+            return
+        self._decode_queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def stats(self):
+        """Returns the current queue depths, the last decoded and applied
+        block numbers, and how many blocks apply lags behind decode.
+        """
+        decoded = self._last_decoded
+        applied = self._last_applied
+        lag = 0
+        if decoded is not None:
+            lag = decoded - (applied if applied is not None else decoded)
+        return {
+            'decode_queue': self._decode_queue.qsize(),
+            'apply_queue': self._apply_queue.qsize(),
+            'last_decoded': decoded,
+            'last_applied': applied,
+            'lag_blocks': lag
+        }
+
+    def _run_decode(self):
+        while True:
+            events = self._decode_queue.get()
+            if events is _STOP:
+                self._apply_queue.put(_STOP)
+                return
+            if self._error is not None:
+                continue
+            try:
+                block = self._decode(events)
+            except Exception as err:  # pylint: disable=broad-except
+                self._fail(err)
+                continue
+            self._last_decoded = block.block_num
+            self._apply_queue.put(block)
+
+    def _run_apply(self):
+        while True:
+            block = self._apply_queue.get()
+            if block is _STOP:
+                return
+            if self._error is not None:
+                continue
+            try:
+                self._apply(block)
+            except Exception as err:  # pylint: disable=broad-except
+                self._fail(err)
+                continue
+            self._last_applied = block.block_num
+
+    def _fail(self, err):
+        LOGGER.exception(err)
+        self._error = err
+
+    def _check_error(self):
+        if self._error is not None:
+            raise RuntimeError(
+                'Ledger sync pipeline stopped: {}'.format(self._error))
+
+    def _maybe_report(self):
+        now = time.monotonic()
+        if now - self._last_report < self._report_interval:
+            return
+        self._last_report = now
+        LOGGER.info(
+            'Pipeline queues: decode %(decode_queue)s, apply %(apply_queue)s; '
+            'last decoded block %(last_decoded)s, last applied block '
+            '%(last_applied)s, lag %(lag_blocks)s blocks', self.stats())
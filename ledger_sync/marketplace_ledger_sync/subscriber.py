@@ -44,6 +44,7 @@ class Subscriber(object):
         LOGGER.info('Connecting to validator: %s', validator_url)
         self._stream = Stream(validator_url)
         self._event_handlers = []
+        self._pipeline = None
         self._is_active = False
 
     def add_handler(self, handler):
@@ -57,6 +58,12 @@ class Subscriber(object):
         """
         self._event_handlers = []
 
+    def set_pipeline(self, pipeline):
+        """Sends events received to an EventPipeline instead of calling the
+        handlers inline, so receiving is not held up by database writes.
+        """
+        self._pipeline = pipeline
+
     def start(self, known_ids=None):
         """Subscribes to state delta events, and then waits to receive deltas.
         Sends any events received to delta handlers.
@@ -103,6 +110,9 @@ class Subscriber(object):
 
             event_list = EventList()
             event_list.ParseFromString(message_future.result().content)
+            if self._pipeline is not None:
+                self._pipeline.put(event_list.events)
+                continue
             for handler in self._event_handlers:
                 handler(event_list.events)
 
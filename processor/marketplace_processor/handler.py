@@ -13,6 +13,9 @@
 # limitations under the License.
 # -----------------------------------------------------------------------------
 
+from collections import namedtuple
+import time
+
 from sawtooth_sdk.processor.exceptions import InvalidTransaction
 from sawtooth_sdk.processor.handler import TransactionHandler
 
@@ -27,6 +30,9 @@ from marketplace_processor.offer import offer_creation
 from marketplace_processor.transfer import transfer_creation
 from marketplace_processor.marketplace_payload import MarketplacePayload
 from marketplace_processor.marketplace_state import MarketplaceState
+from marketplace_processor.metrics import REGISTRY
+from marketplace_processor.metrics import StageTimer
+from marketplace_processor.protobuf import payload_pb2
 
 
 class MarketplaceHandler(TransactionHandler):
@@ -45,45 +51,190 @@ class MarketplaceHandler(TransactionHandler):
 
     def apply(self, transaction, context):
 
-        state = MarketplaceState(context=context, timeout=2)
-        payload = MarketplacePayload(payload=transaction.payload)
-
-        if payload.is_create_account():
-            account_creation.handle_account_creation(
-                payload.create_account(),
-                header=transaction.header,
-                state=state)
-        elif payload.is_create_resource():
-            resource_creation.handle_resource_creation(
-                payload.create_resource(),
-                header=transaction.header,
-                state=state)
-        elif payload.is_create_asset():
-            asset_creation.handle_asset_creation(
-                payload.create_asset(),
-                header=transaction.header,
-                state=state)
-        elif payload.is_create_offer():
-            offer_creation.handle_offer_creation(
-                payload.create_offer(),
-                header=transaction.header,
-                state=state)
-        elif payload.is_accept_offer():
-            offer_acceptance.handle_accept_offer(
-                payload.accept_offer(),
-                header=transaction.header,
-                state=state)
-        elif payload.is_close_offer():
-            offer_closure.handle_close_offer(
-                payload.close_offer(),
-                header=transaction.header,
-                state=state)
-        elif payload.is_transfer_asset():
-            # print("payload.transfer_asset() ==============> " , payload.transfer_asset())
-            transfer_creation.handle_transfer_asset(
-                payload.transfer_asset(),
-                header=transaction.header,
-                state=state)
-
-        else:
+        timer = StageTimer()
+        with timer.time('parse'):
+            payload = MarketplacePayload(payload=transaction.payload)
+
+        try:
+            route = ROUTES[payload.payload_type()]
+        except KeyError:
             raise InvalidTransaction("Transaction payload type unknown.")
+
+        message = route.get_payload(payload)
+        header = transaction.header
+
+        try:
+            with timer.time('total'):
+                _validate_addresses(header, *route.addresses(message, header))
+
+                state = MarketplaceState(
+                    context=context,
+                    timeout=2,
+                    defer_writes=True,
+                    timer=timer)
+                state.prefetch(header.inputs)
+
+                state_time = _state_read_time(timer)
+                start = time.perf_counter()
+                route.handle(message, header=header, state=state)
+                timer.add(
+                    'validation',
+                    time.perf_counter() - start -
+                    (_state_read_time(timer) - state_time))
+
+                state.flush()
+        finally:
+            REGISTRY.record(payload.payload_type_name(), timer)
+
+
+def _state_read_time(timer):
+    return timer.total('get_state') + timer.total('parse')
+
+
+def _validate_addresses(header, inputs, outputs):
+    """Checks that the addresses a payload is known to touch are covered by
+    the inputs and outputs declared in the transaction header, either
+    exactly or by a declared prefix.
+
+    Raises:
+        InvalidTransaction
+            - A required address is not declared.
+    """
+
+    for address in inputs:
+        if not _is_declared(address, header.inputs):
+            raise InvalidTransaction(
+                "Address {} is read but is not in the transaction "
+                "inputs".format(address))
+    for address in outputs:
+        if not _is_declared(address, header.outputs):
+            raise InvalidTransaction(
+                "Address {} is written but is not in the transaction "
+                "outputs".format(address))
+
+
+def _is_declared(address, declared):
+    for prefix in declared:
+        if address.startswith(prefix):
+            return True
+    return False
+
+
+def _account_addresses(create_account, header):
+    account = addresser.make_account_address(header.signer_public_key)
+    return [account], [account]
+
+
+def _resource_addresses(create_resource, header):
+    resource = addresser.make_resource_address(create_resource.name)
+    account = addresser.make_account_address(header.signer_public_key)
+    return [resource, account], [resource]
+
+
+def _asset_addresses(create_asset, header):
+    asset = addresser.make_asset_address(create_asset.id)
+    account = addresser.make_account_address(header.signer_public_key)
+    resource = addresser.make_resource_address(create_asset.resource)
+    return [account, resource, asset], [asset, account]
+
+
+def _create_offer_addresses(create_offer, header):
+    offer = addresser.make_offer_address(create_offer.id)
+    inputs = [addresser.make_account_address(header.signer_public_key),
+              addresser.make_asset_address(create_offer.source),
+              offer]
+    if create_offer.target:
+        inputs.append(addresser.make_asset_address(create_offer.target))
+    return inputs, [offer]
+
+
+def _accept_offer_addresses(accept_offer, header):
+    assets = [addresser.make_asset_address(accept_offer.target)]
+    if accept_offer.source:
+        assets.append(addresser.make_asset_address(accept_offer.source))
+    history = [
+        addresser.make_offer_history_address(accept_offer.id),
+        addresser.make_offer_account_address(
+            offer_id=accept_offer.id,
+            account=header.signer_public_key)]
+    inputs = assets + history + [
+        addresser.make_offer_address(accept_offer.id)]
+    return inputs, assets + history
+
+
+def _close_offer_addresses(close_offer, header):
+    offer = addresser.make_offer_address(close_offer.id)
+    return [offer], [offer]
+
+
+def _transfer_addresses(transfer_asset, header):
+    addresses = [
+        addresser.make_asset_address(transfer_asset.source),
+        addresser.make_asset_address(transfer_asset.target),
+        addresser.make_transfer_address(
+            transfer_id=transfer_asset.id,
+            account=header.signer_public_key)]
+    return addresses, addresses
+
+
+PayloadRoute = namedtuple(
+    'PayloadRoute', ['get_payload', 'handle', 'addresses'])
+
+ROUTES = {}
+
+
+def register_payload(payload_type, get_payload, handle, addresses):
+    """Registers the handling of a payload type.
+
+    Args:
+        payload_type (TransactionPayload.PayloadType): The payload type.
+        get_payload (function): Takes a MarketplacePayload and returns the
+            payload message for this type.
+        handle (function): Takes the payload message, header and state, and
+            applies the transaction.
+        addresses (function): Takes the payload message and header, and
+            returns the lists of input and output addresses the handler
+            is known to use. These must be declared in the header.
+    """
+
+    ROUTES[payload_type] = PayloadRoute(
+        get_payload=get_payload,
+        handle=handle,
+        addresses=addresses)
+
+
+register_payload(
+    payload_pb2.TransactionPayload.CREATE_ACCOUNT,
+    MarketplacePayload.create_account,
+    account_creation.handle_account_creation,
+    _account_addresses)
+register_payload(
+    payload_pb2.TransactionPayload.CREATE_RESOURCE,
+    MarketplacePayload.create_resource,
+    resource_creation.handle_resource_creation,
+    _resource_addresses)
+register_payload(
+    payload_pb2.TransactionPayload.CREATE_ASSET,
+    MarketplacePayload.create_asset,
+    asset_creation.handle_asset_creation,
+    _asset_addresses)
+register_payload(
+    payload_pb2.TransactionPayload.CREATE_OFFER,
+    MarketplacePayload.create_offer,
+    offer_creation.handle_offer_creation,
+    _create_offer_addresses)
+register_payload(
+    payload_pb2.TransactionPayload.ACCEPT_OFFER,
+    MarketplacePayload.accept_offer,
+    offer_acceptance.handle_accept_offer,
+    _accept_offer_addresses)
+register_payload(
+    payload_pb2.TransactionPayload.CLOSE_OFFER,
+    MarketplacePayload.close_offer,
+    offer_closure.handle_close_offer,
+    _close_offer_addresses)
+register_payload(
+    payload_pb2.TransactionPayload.TRANSFER_ASSET,
+    MarketplacePayload.transfer_asset,
+    transfer_creation.handle_transfer_asset,
+    _transfer_addresses)
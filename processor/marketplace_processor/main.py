@@ -13,8 +13,12 @@
 # limitations under the License.
 # -----------------------------------------------------------------------------
 
+import os
 import sys
 import argparse
+import multiprocessing
+import multiprocessing.connection
+import signal
 
 from sawtooth_sdk.processor.core import TransactionProcessor
 from sawtooth_sdk.processor.log import init_console_logging
@@ -23,6 +27,10 @@ from sawtooth_sdk.processor.config import get_log_config
 from sawtooth_sdk.processor.config import get_log_dir
 
 from marketplace_processor.handler import MarketplaceHandler
+from marketplace_processor import metrics
+
+
+SHUTDOWN_TIMEOUT = 10
 
 
 def parse_args(args):
@@ -39,6 +47,22 @@ def parse_args(args):
                         default=0,
                         help='Increase output sent to stderr')
 
+    parser.add_argument('-w', '--workers',
+                        type=int,
+                        default=1,
+                        help='Number of processor processes to run, each '
+                             'registering with the validator')
+
+    parser.add_argument('--metrics-port',
+                        type=int,
+                        help='Serve per-payload-type latency histograms on '
+                             'this local port at /metrics. Worker N uses '
+                             'this port plus N')
+
+    parser.add_argument('--metrics-file',
+                        help='Write latency histograms to this file on '
+                             'SIGUSR1. Worker N appends .N to the name')
+
     return parser.parse_args(args)
 
 
@@ -46,6 +70,51 @@ def main(args=None):
     if args is None:
         args = sys.argv[1:]
     opts = parse_args(args)
+
+    if opts.workers > 1:
+        _run_workers(opts)
+    else:
+        _run_processor(opts)
+
+
+def _run_workers(opts):
+    """Runs opts.workers processor processes, each registering with the
+    validator on its own, and stops them all as soon as one exits or this
+    process is interrupted or terminated.
+    """
+
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+
+    workers = [
+        multiprocessing.Process(
+            target=_run_processor,
+            args=(opts, index),
+            name='marketplace-tp-{}'.format(index))
+        for index in range(opts.workers)
+    ]
+    try:
+        for worker in workers:
+            worker.start()
+        multiprocessing.connection.wait([w.sentinel for w in workers])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        for worker in workers:
+            worker.join(SHUTDOWN_TIMEOUT)
+            if worker.is_alive():
+                print("Error: worker {} did not stop, killing it".format(
+                    worker.name), file=sys.stderr)
+                os.kill(worker.pid, signal.SIGKILL)
+
+
+def _run_processor(opts, worker_index=None):
+    if worker_index is not None:
+        # Worker processes are stopped by the parent with SIGTERM
+        signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+
     processor = None
     try:
         processor = TransactionProcessor(url=opts.connect)
@@ -66,6 +135,14 @@ def main(args=None):
 
         init_console_logging(verbose_level=opts.verbose)
 
+        if opts.metrics_port is not None:
+            metrics.start_http_server(
+                opts.metrics_port + (worker_index or 0))
+        if opts.metrics_file is not None:
+            metrics.dump_on_signal(
+                opts.metrics_file if worker_index is None
+                else '{}.{}'.format(opts.metrics_file, worker_index))
+
         handler = MarketplaceHandler()
 
         processor.add_handler(handler)
@@ -78,3 +155,7 @@ def main(args=None):
     finally:
         if processor is not None:
             processor.stop()
+
+
+def _raise_keyboard_interrupt(signum, frame):  # pylint: disable=W0613
+    raise KeyboardInterrupt()
@@ -22,6 +22,28 @@ class MarketplacePayload(object):
         self._transaction = payload_pb2.TransactionPayload()
         self._transaction.ParseFromString(payload)
 
+    def payload_type(self):
+        """Returns the payload type.
+
+        Returns:
+            payload_pb2.TransactionPayload.PayloadType
+        """
+
+        return self._transaction.payload_type
+
+    def payload_type_name(self):
+        """Returns the name of the payload type, e.g. ACCEPT_OFFER.
+
+        Returns:
+            str
+        """
+
+        try:
+            return payload_pb2.TransactionPayload.PayloadType.Name(
+                self._transaction.payload_type)
+        except ValueError:
+            return 'UNKNOWN'
+
     def create_account(self):
         """Returns the value set in the create_account.
 
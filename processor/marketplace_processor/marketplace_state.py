@@ -13,7 +13,12 @@
 # limitations under the License.
 # -----------------------------------------------------------------------------
 
+import logging
+from operator import attrgetter
+
 from marketplace_addressing import addresser
+from marketplace_processor.metrics import StageTimer
+from marketplace_processor import structured_log
 from marketplace_processor.protobuf import account_pb2
 from marketplace_processor.protobuf import resource_pb2
 from marketplace_processor.protobuf import asset_pb2
@@ -27,33 +32,113 @@ OFFER_RULES = [rule_pb2.Rule.EXCHANGE_ONCE_PER_ACCOUNT,
                rule_pb2.Rule.EXCHANGE_ONCE,
                rule_pb2.Rule.EXCHANGE_LIMITED_TO_ACCOUNTS]
 
+LOGGER = logging.getLogger(__name__)
+
+CONTAINERS = {
+    addresser.AddressSpace.RESOURCE: resource_pb2.ResourceContainer,
+    addresser.AddressSpace.ASSET: asset_pb2.AssetContainer,
+    addresser.AddressSpace.ACCOUNT: account_pb2.AccountContainer,
+    addresser.AddressSpace.OFFER: offer_pb2.OfferContainer,
+    addresser.AddressSpace.OFFER_HISTORY:
+        offer_history_pb2.OfferHistoryContainer,
+    addresser.AddressSpace.TRANSFER: transfer_pb2.TransferContainer
+}
+
+ADDRESS_LENGTH = 70
+
+# The field(s) identifying the entries of each kind of container
+ENTRY_KEYS = {
+    resource_pb2.ResourceContainer: attrgetter('name'),
+    asset_pb2.AssetContainer: attrgetter('id'),
+    account_pb2.AccountContainer: attrgetter('public_key'),
+    offer_pb2.OfferContainer: attrgetter('id'),
+    offer_history_pb2.OfferHistoryContainer:
+        attrgetter('offer_id', 'account_id'),
+    transfer_pb2.TransferContainer: attrgetter('id')
+}
+
 
 class MarketplaceState(object):
 
-    def __init__(self, context, timeout=2):
+    def __init__(self, context, timeout=2, defer_writes=False, timer=None):
+        """Constructor.
+
+        Args:
+            context (sawtooth_sdk.processor.context.Context): The context
+                of the transaction being applied.
+            timeout (int): Seconds to wait on the validator for state
+                reads and writes.
+            defer_writes (bool): Record modified containers instead of
+                writing each one immediately. They are then written together
+                by flush().
+            timer (StageTimer): Accumulates the time spent reading,
+                parsing, serializing and writing state.
+        """
+
         self._context = context
         self._timeout = timeout
-        self._state_entries = []
+        self._containers = {}
+        self._indexes = {}
+        self._defer_writes = defer_writes
+        self._dirty = set()
+        self._timer = timer if timer is not None else StageTimer()
+
+    def prefetch(self, addresses):
+        """Reads every full marketplace address in one get_state call and
+        caches the parsed containers, so later lookups of those addresses
+        need no further round-trips to the validator.
+
+        Args:
+            addresses (list of str): State addresses, typically the inputs
+                declared in the transaction header. Namespace prefixes and
+                addresses already cached are skipped.
+        """
+
+        to_fetch = {}
+        for address in addresses:
+            if len(address) != ADDRESS_LENGTH or address in self._containers:
+                continue
+            container_class = CONTAINERS.get(addresser.address_is(address))
+            if container_class is not None:
+                to_fetch[address] = container_class
+
+        if not to_fetch:
+            return
+
+        with self._timer.time('get_state'):
+            entries = self._context.get_state(
+                addresses=list(to_fetch),
+                timeout=self._timeout)
+        data = {entry.address: entry.data for entry in entries}
+
+        with self._timer.time('parse'):
+            for address, container_class in to_fetch.items():
+                container = container_class()
+                if address in data:
+                    container.ParseFromString(data[address])
+                self._containers[address] = container
 
     def get_transfer(self, identifier , account):
-        address = addresser.make_transfer_address(transfer_id=identifier, account = account)
-        print("address ========= state ===========> " , address)
+        address = addresser.make_transfer_address(
+            transfer_id=identifier,
+            account=account)
+        transfer = self._get_transfer(address=address, identifier=identifier)
 
-        self._state_entries.extend(self._context.get_state(
-            addresses=[address],
-            timeout=self._timeout))       
-        
-        print("_context.get_state ========= state ===========> " , self._context.get_state(addresses=[address],timeout=self._timeout))
-        print("self._get_transfer ========= state ===========> " , self._get_transfer(address=address, identifier=identifier))
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            structured_log.debug(
+                LOGGER, 'get_transfer',
+                address=address,
+                container=self._containers[address],
+                transfer=transfer)
 
-        return self._get_transfer(address=address, identifier=identifier)
+        return transfer
 
     def _get_transfer(self, address, identifier):
 
-        container = _get_transfer_container(self._state_entries, address)
         transfer = None
         try:
-            transfer = _get_transfer_from_container(container, identifier)
+            transfer = self._get_entry(
+                address, transfer_pb2.TransferContainer, identifier)
         except KeyError:
             # We are fine with returning None
             pass
@@ -62,18 +147,14 @@ class MarketplaceState(object):
 
     def get_offer(self, identifier):
         address = addresser.make_offer_address(offer_id=identifier)
-        self._state_entries.extend(self._context.get_state(
-            addresses=[address],
-            timeout=self._timeout))
-
         return self._get_offer(address=address, identifier=identifier)
 
     def _get_offer(self, address, identifier):
 
-        container = _get_offer_container(self._state_entries, address)
         offer = None
         try:
-            offer = _get_offer_from_container(container, identifier)
+            offer = self._get_entry(
+                address, offer_pb2.OfferContainer, identifier)
         except KeyError:
             # We are fine with returning None
             pass
@@ -91,13 +172,13 @@ class MarketplaceState(object):
                          target_quantity,
                          rules):
         address = addresser.make_offer_address(offer_id=identifier)
-        container = _get_offer_container(self._state_entries, address)
-
         try:
-            offer = _get_offer_from_container(container, identifier)
+            offer = self._get_entry(
+                address, offer_pb2.OfferContainer, identifier)
 
         except KeyError:
-            offer = container.entries.add()
+            offer = self._add_entry(
+                address, offer_pb2.OfferContainer, identifier)
 
         offer.id = identifier
         offer.label = label
@@ -114,11 +195,7 @@ class MarketplaceState(object):
         if target:
             offer.rules.extend(self._return_offer_rules(target))
 
-        state_entries_send = {}
-        state_entries_send[address] = container.SerializeToString()
-        return self._context.set_state(
-            state_entries_send,
-            self._timeout)
+        return self._save(address)
 
     def _return_offer_rules(self, asset_id,):
         asset_addr = addresser.make_asset_address(asset_id)
@@ -128,38 +205,29 @@ class MarketplaceState(object):
 
     def close_offer(self, identifier):
         address = addresser.make_offer_address(offer_id=identifier)
-        container = _get_offer_container(self._state_entries, address)
-
         try:
-            offer = _get_offer_from_container(container, identifier)
+            offer = self._get_entry(
+                address, offer_pb2.OfferContainer, identifier)
 
         except KeyError:
-            offer = container.entries.add()
+            offer = self._add_entry(
+                address, offer_pb2.OfferContainer, identifier)
 
         offer.status = offer_pb2.Offer.CLOSED
 
-        state_entries_send = {}
-        state_entries_send[address] = container.SerializeToString()
-        return self._context.set_state(
-            state_entries_send,
-            self._timeout)
+        return self._save(address)
 
     def get_asset(self, identifier):
         address = addresser.make_asset_address(asset_id=identifier)
 
-        self._state_entries.extend(self._context.get_state(
-            addresses=[address],
-            timeout=self._timeout))
-
         return self._get_asset(address=address, identifier=identifier)
 
     def _get_asset(self, address, identifier):
 
-        container = _get_asset_container(self._state_entries, address)
-
         asset = None
         try:
-            asset = _get_asset_from_container(container, identifier)
+            asset = self._get_entry(
+                address, asset_pb2.AssetContainer, identifier)
         except KeyError:
             # Fine with returning None
             pass
@@ -173,12 +241,12 @@ class MarketplaceState(object):
                     resource,
                     quantity):
         address = addresser.make_asset_address(asset_id=identifier)
-        container = _get_asset_container(self._state_entries, address)
-
         try:
-            asset = _get_asset_from_container(container, identifier)
+            asset = self._get_entry(
+                address, asset_pb2.AssetContainer, identifier)
         except KeyError:
-            asset = container.entries.add()
+            asset = self._add_entry(
+                address, asset_pb2.AssetContainer, identifier)
 
         asset.id = identifier
         asset.label = label
@@ -187,48 +255,45 @@ class MarketplaceState(object):
         asset.resource = resource
         asset.quantity = quantity
 
-        state_entries_send = {}
-        state_entries_send[address] = container.SerializeToString()
-        return self._context.set_state(
-            state_entries_send,
-            self._timeout)
+        return self._save(address)
 
-    def change_asset_quantity(self,
-                                identifier,
-                                new_quantity):
-        address = addresser.make_asset_address(asset_id=identifier)
-        container = _get_asset_container(self._state_entries, address)
+    def adjust_asset_quantity(self, identifier, amount):
+        """Adds amount, which may be negative, to an Asset's quantity.
+
+        The Asset is changed in place within the transaction's cached
+        container, so several adjustments to one Asset (for instance
+        when the same Asset is on both sides of an exchange) all apply
+        to its current quantity.
 
+        Args:
+            identifier (str): The Asset id.
+            amount (int): The change in quantity.
+        """
+
+        address = addresser.make_asset_address(asset_id=identifier)
         try:
-            asset = _get_asset_from_container(container, identifier)
+            asset = self._get_entry(
+                address, asset_pb2.AssetContainer, identifier)
         except KeyError:
-            asset = container.entries.add()
+            asset = self._add_entry(
+                address, asset_pb2.AssetContainer, identifier)
+            asset.id = identifier
 
-        asset.quantity = new_quantity
+        asset.quantity += amount
 
-        state_entries_send = {}
-        state_entries_send[address] = container.SerializeToString()
-
-        return self._context.set_state(
-            state_entries_send,
-            self._timeout)
+        return self._save(address)
 
     def get_resource(self, name):
         address = addresser.make_resource_address(resource_id=name)
 
-        self._state_entries.extend(self._context.get_state(
-            addresses=[address],
-            timeout=self._timeout))
-
         return self._get_resource(address=address, name=name)
 
     def _get_resource(self, address, name):
 
-        container = _get_resource_container(self._state_entries, address)
-
         resource = None
         try:
-            resource = _get_resource_from_container(container, name)
+            resource = self._get_entry(
+                address, resource_pb2.ResourceContainer, name)
         except KeyError:
             # We are fine with returning None for an resource that doesn't exist
             pass
@@ -237,37 +302,27 @@ class MarketplaceState(object):
     def set_resource(self, name, description, owners, rules):
         address = addresser.make_resource_address(name)
 
-        container = _get_resource_container(self._state_entries, address)
-
         try:
-            resource = _get_resource_from_container(container, name)
+            resource = self._get_entry(
+                address, resource_pb2.ResourceContainer, name)
         except KeyError:
-            resource = container.entries.add()
+            resource = self._add_entry(
+                address, resource_pb2.ResourceContainer, name)
 
         resource.name = name
         resource.description = description
         resource.owners.extend(owners)
         resource.rules.extend(rules)
 
-        state_entries_send = {}
-        state_entries_send[address] = container.SerializeToString()
-        return self._context.set_state(
-            state_entries_send,
-            self._timeout)
+        return self._save(address)
 
     def get_account(self, public_key):
         address = addresser.make_account_address(account_id=public_key)
 
-        self._state_entries.extend(self._context.get_state(
-            addresses=[address],
-            timeout=self._timeout))
-
-        container = _get_account_container(self._state_entries, address)
         account = None
         try:
-            account = _get_account_from_container(
-                container,
-                identifier=public_key)
+            account = self._get_entry(
+                address, account_pb2.AccountContainer, public_key)
         except KeyError:
             # We are fine with returning None for an account that doesn't
             # exist in state.
@@ -277,14 +332,12 @@ class MarketplaceState(object):
     def set_account(self, public_key, label, description, assets):
         address = addresser.make_account_address(account_id=public_key)
 
-        container = _get_account_container(self._state_entries, address)
-
         try:
-            account = _get_account_from_container(
-                container,
-                public_key)
+            account = self._get_entry(
+                address, account_pb2.AccountContainer, public_key)
         except KeyError:
-            account = container.entries.add()
+            account = self._add_entry(
+                address, account_pb2.AccountContainer, public_key)
 
         account.public_key = public_key
         account.label = label
@@ -292,77 +345,47 @@ class MarketplaceState(object):
         for asset in assets:
             account.assets.append(asset)
 
-        state_entries_send = {}
-        state_entries_send[address] = container.SerializeToString()
-        return self._context.set_state(
-            state_entries_send,
-            self._timeout)
+        return self._save(address)
 
     def add_asset_to_account(self, public_key, asset_id):
         address = addresser.make_account_address(account_id=public_key)
 
-        container = _get_account_container(self._state_entries, address)
-
         try:
-            account = _get_account_from_container(
-                container,
-                public_key)
+            account = self._get_entry(
+                address, account_pb2.AccountContainer, public_key)
         except KeyError:
-            account = container.entries.add()
+            account = self._add_entry(
+                address, account_pb2.AccountContainer, public_key)
 
         account.assets.append(asset_id)
 
-        state_entries_send = {}
-        state_entries_send[address] = container.SerializeToString()
-        return self._context.set_state(
-            state_entries_send,
-            self._timeout)
+        return self._save(address)
 
     def save_offer_account_receipt(self, offer_id, account):
         address = addresser.make_offer_account_address(
             offer_id=offer_id,
             account=account)
 
-        container = _get_history_container(self._state_entries, address)
-        offer_history = container.entries.add()
-
-        offer_history.offer_id = offer_id
-        offer_history.account_id = account
+        self._add_history(address, offer_id, account)
 
-        state_entries_send = {}
-        state_entries_send[address] = container.SerializeToString()
-        return self._context.set_state(
-            state_entries_send,
-            self._timeout)
+        return self._save(address)
 
     def save_offer_receipt(self, offer_id):
         address = addresser.make_offer_history_address(offer_id=offer_id)
 
-        container = _get_history_container(self._state_entries, address)
-        offer_history = container.entries.add()
-
-        offer_history.offer_id = offer_id
+        self._add_history(address, offer_id, '')
 
-        state_entries_send = {}
-        state_entries_send[address] = container.SerializeToString()
-        return self._context.set_state(
-            state_entries_send,
-            self._timeout)
+        return self._save(address)
 
     def offer_has_receipt(self, offer_id):
         address = addresser.make_offer_history_address(
             offer_id=offer_id)
 
-        self._state_entries.extend(self._context.get_state(
-            addresses=[address],
-            timeout=self._timeout))
-
-        container = _get_history_container(self._state_entries, address)
-
+        # Receipts at this address are saved with no account
         try:
-            _get_history_by_offer_id(
-                container,
-                offer_id=offer_id)
+            self._get_entry(
+                address, offer_history_pb2.OfferHistoryContainer,
+                (offer_id, ''))
             return True
         except KeyError:
             return False
@@ -372,144 +395,137 @@ class MarketplaceState(object):
             offer_id=offer_id,
             account=account)
 
-        self._state_entries.extend(self._context.get_state(
-            addresses=[address],
-            timeout=self._timeout))
-
-        container = _get_history_container(self._state_entries, address)
         offer_history = None
         try:
-            offer_history = _get_history_from_container(
-                container,
-                offer_id=offer_id,
-                account=account)
+            offer_history = self._get_entry(
+                address, offer_history_pb2.OfferHistoryContainer,
+                (offer_id, account))
         except KeyError:
             # we are fine returning None
             pass
 
         return offer_history
 
+    def flush(self):
+        """Writes every container modified since the last flush in a single
+        set_state call. Each address is serialized once, with the latest
+        contents of its container.
+
+        Returns:
+            list of str: The addresses that were set.
+        """
+
+        if not self._dirty:
+            return []
+
+        with self._timer.time('serialize'):
+            state_entries_send = {
+                address: self._containers[address].SerializeToString()
+                for address in self._dirty
+            }
+        self._dirty.clear()
+        with self._timer.time('set_state'):
+            return self._context.set_state(
+                state_entries_send,
+                self._timeout)
+
+    def _save(self, address):
+        self._dirty.add(address)
+        if self._defer_writes:
+            return [address]
+        return self.flush()
+
+    def _add_history(self, address, offer_id, account):
+        """Appends an OfferHistory entry, as receipts always have been, so
+        the serialized container is unchanged.
+        """
+
+        index = self._get_index(
+            address, offer_history_pb2.OfferHistoryContainer)
+        container = self._get_container(
+            address, offer_history_pb2.OfferHistoryContainer)
 
-def _get_history_container(state_entries, address):
-    try:
-        entry = _find_in_state(state_entries, address)
-        container = offer_history_pb2.OfferHistoryContainer()
-        container.ParseFromString(entry.data)
-    except KeyError:
-        container = offer_history_pb2.OfferHistoryContainer()
-
-    return container
-
-
-def _get_history_by_offer_id(container, offer_id):
-    for offer_history in container.entries:
-        if offer_history.offer_id == offer_id:
-            return offer_history
-    raise KeyError("OfferHistory not found in container.")
-
-
-def _get_history_from_container(container, offer_id, account):
-    for offer_history in container.entries:
-        if offer_history.offer_id == offer_id \
-                and offer_history.account_id == account:
-            return offer_history
-    raise KeyError("OfferHistory not found in container.")
-
-
-def _get_transfer_container(state_entries, address):
-    try:
-        entry = _find_in_state(state_entries, address)
-        container = transfer_pb2.TransferContainer()
-        container.ParseFromString(entry.data)
-    except KeyError:
-        container = transfer_pb2.TransferContainer()
-
-    return container
-
-def _get_transfer_from_container(container, transfer_id):
-    for transfer in container.entries:
-        if transfer.id == transfer_id:
-            return transfer
-    raise KeyError(
-        "Transfer with id {} is not in container".format(transfer_id))
-
-def _get_offer_container(state_entries, address):
-    try:
-        entry = _find_in_state(state_entries, address)
-        container = offer_pb2.OfferContainer()
-        container.ParseFromString(entry.data)
-    except KeyError:
-        container = offer_pb2.OfferContainer()
+        offer_history = container.entries.add()
+        offer_history.offer_id = offer_id
+        offer_history.account_id = account
 
-    return container
+        index.setdefault((offer_id, account), offer_history)
 
+    def _get_entry(self, address, container_class, key):
+        """Returns the entry of the container at an address with the given
+        key, as defined by ENTRY_KEYS.
 
-def _get_offer_from_container(container, offer_id):
-    for offer in container.entries:
-        if offer.id == offer_id:
-            return offer
-    raise KeyError(
-        "Offer with id {} is not in container".format(offer_id))
+        Raises:
+            KeyError: There is no such entry.
+        """
 
+        try:
+            return self._get_index(address, container_class)[key]
+        except KeyError:
+            raise KeyError(
+                "Entry {} is not in the container at {}".format(
+                    key, address))
 
-def _get_asset_container(state_entries, address):
-    try:
-        entry = _find_in_state(state_entries, address)
-        container = asset_pb2.AssetContainer()
-        container.ParseFromString(entry.data)
-    except KeyError:
-        container = asset_pb2.AssetContainer()
+    def _add_entry(self, address, container_class, key):
+        """Adds an empty entry to the container at an address, indexed under
+        key. The caller sets the entry's fields, including its key.
+        """
 
-    return container
+        container = self._get_container(address, container_class)
+        entry = container.entries.add()
+        self._get_index(address, container_class)[key] = entry
+        return entry
 
+    def _get_index(self, address, container_class):
+        """Returns a dict of the entries of the container at an address by
+        key, built the first time the address is looked up.
+        """
 
-def _get_asset_from_container(container, asset_id):
-    for asset in container.entries:
-        if asset.id == asset_id:
-            return asset
-    raise KeyError(
-        "Asset with id {} is not in container".format(asset_id))
+        try:
+            return self._indexes[address]
+        except KeyError:
+            pass
 
+        container = self._get_container(address, container_class)
+        key = ENTRY_KEYS[container_class]
+        index = {}
+        for entry in container.entries:
+            # Keep the first entry with a key, as a linear scan would
+            index.setdefault(key(entry), entry)
 
-def _get_resource_container(state_entries, address):
-    try:
-        entry = _find_in_state(state_entries, address)
-        container = resource_pb2.ResourceContainer()
-        container.ParseFromString(entry.data)
-    except KeyError:
-        container = resource_pb2.ResourceContainer()
-    return container
+        self._indexes[address] = index
+        return index
 
+    def _get_container(self, address, container_class):
+        """Returns the parsed container at an address, fetching it from the
+        validator only the first time it is requested in this transaction.
 
-def _get_resource_from_container(container, name):
-    for resource in container.entries:
-        if resource.name == name:
-            return resource
-    raise KeyError(
-        "Resource with name {} is not in container".format(name))
+        Args:
+            address (str): The state address.
+            container_class (type): The protobuf container class stored at
+                the address.
 
+        Returns:
+            The container message, shared by all later lookups of the
+            address.
+        """
 
-def _get_account_container(state_entries, address):
-    try:
-        entry = _find_in_state(state_entries, address)
-        container = account_pb2.AccountContainer()
-        container.ParseFromString(entry.data)
-    except KeyError:
-        container = account_pb2.AccountContainer()
+        try:
+            return self._containers[address]
+        except KeyError:
+            pass
 
-    return container
+        with self._timer.time('get_state'):
+            entries = self._context.get_state(
+                addresses=[address],
+                timeout=self._timeout)
 
+        container = container_class()
+        with self._timer.time('parse'):
+            for entry in entries:
+                if entry.address == address:
+                    container.ParseFromString(entry.data)
 
-def _get_account_from_container(container, identifier):
-    for account in container.entries:
-        if account.public_key == identifier:
-            return account
-    raise KeyError(
-        "Account with identifier {} is not in container.".format(identifier))
+        self._containers[address] = container
+        return container
 
-
-def _find_in_state(state_entries, address):
-    for entry in state_entries:
-        if entry.address == address:
-            return entry
-    raise KeyError("Address {} not found in state".format(address))
@@ -0,0 +1,178 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+import logging
+import signal
+import threading
+import time
+
+
+LOGGER = logging.getLogger(__name__)
+
+METRIC_NAME = 'marketplace_tp_stage_seconds'
+
+BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+           0.5, 1.0, 2.5, 5.0]
+
+
+class StageTimer(object):
+    """Accumulates the time one transaction spends in each stage of
+    processing.
+    """
+
+    def __init__(self):
+        self._totals = defaultdict(float)
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._totals[stage] += time.perf_counter() - start
+
+    def add(self, stage, seconds):
+        self._totals[stage] += seconds
+
+    def total(self, stage):
+        return self._totals.get(stage, 0.0)
+
+    def items(self):
+        return self._totals.items()
+
+
+class Histogram(object):
+    """A cumulative histogram in the Prometheus style.
+    """
+
+    def __init__(self, buckets=None):
+        self._bounds = list(buckets or BUCKETS)
+        self._counts = [0] * len(self._bounds)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self._bounds):
+            if value <= bound:
+                self._counts[i] += 1
+        self._sum += value
+        self._count += 1
+
+    def samples(self):
+        """Returns (le, cumulative count) pairs followed by the sum and the
+        total count.
+        """
+        buckets = [('{}'.format(b), c)
+                   for b, c in zip(self._bounds, self._counts)]
+        buckets.append(('+Inf', self._count))
+        return buckets, self._sum, self._count
+
+
+class MetricsRegistry(object):
+    """Histograms of stage latency, labeled by payload type and stage.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def record(self, payload_type, timer):
+        """Observes every stage accumulated by a StageTimer under the given
+        payload type.
+
+        Args:
+            payload_type (str): The name of the payload type.
+            timer (StageTimer): The timings of one transaction.
+        """
+
+        with self._lock:
+            for stage, seconds in timer.items():
+                key = (payload_type, stage)
+                try:
+                    histogram = self._histograms[key]
+                except KeyError:
+                    histogram = self._histograms[key] = Histogram()
+                histogram.observe(seconds)
+
+    def render(self):
+        """Returns the histograms in the Prometheus text exposition format.
+        """
+
+        lines = [
+            '# HELP {} Time spent per transaction in each stage of '
+            'processing.'.format(METRIC_NAME),
+            '# TYPE {} histogram'.format(METRIC_NAME)
+        ]
+        with self._lock:
+            for (payload_type, stage), histogram in sorted(
+                    self._histograms.items()):
+                labels = 'payload_type="{}",stage="{}"'.format(
+                    payload_type, stage)
+                buckets, total, count = histogram.samples()
+                for bound, bucket_count in buckets:
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                        METRIC_NAME, labels, bound, bucket_count))
+                lines.append('{}_sum{{{}}} {}'.format(
+                    METRIC_NAME, labels, total))
+                lines.append('{}_count{{{}}} {}'.format(
+                    METRIC_NAME, labels, count))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def start_http_server(port, registry=REGISTRY, host='127.0.0.1'):
+    """Serves the registry on http://host:port/metrics from a daemon thread.
+    """
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # pylint: disable=W0622
+            LOGGER.debug(format, *args)
+
+    server = HTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    LOGGER.info('Serving processor metrics on %s:%s', host, port)
+    return server
+
+
+def dump_on_signal(path, registry=REGISTRY, signum=signal.SIGUSR1):
+    """Installs a signal handler that writes the registry to a file. Must be
+    called from the main thread.
+    """
+
+    def _dump(signum, frame):  # pylint: disable=unused-argument
+        with open(path, 'w') as metrics_file:
+            metrics_file.write(registry.render())
+        LOGGER.info('Wrote processor metrics to %s', path)
+
+    signal.signal(signum, _dump)
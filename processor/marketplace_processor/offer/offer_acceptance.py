@@ -212,28 +212,28 @@ class OfferAcceptance(object):
     def handle_offerer_source(self, input_quantity):
         if not _asset_is_infinite(self._offerer.source_resource,
                                     self._offerer.source.account):
-            self._state.change_asset_quantity(
+            self._state.adjust_asset_quantity(
                 self._offerer.source.id,
-                self._offerer.source.quantity - input_quantity)
+                -input_quantity)
 
     def handle_offerer_target(self, output_quantity):
         if self._offer.target:
-            self._state.change_asset_quantity(
+            self._state.adjust_asset_quantity(
                 self._offerer.target.id,
-                self._offerer.target.quantity + output_quantity)
+                output_quantity)
 
     def handle_receiver_source(self, output_quantity):
         if self._accept_offer.source and not _asset_is_infinite(
                 self._receiver.source_resource,
                 self._receiver.source.account):
-            self._state.change_asset_quantity(
+            self._state.adjust_asset_quantity(
                 self._receiver.source.id,
-                self._receiver.source.quantity - output_quantity)
+                -output_quantity)
 
     def handle_receiver_target(self, input_quantity):
-        self._state.change_asset_quantity(
+        self._state.adjust_asset_quantity(
             self._receiver.target.id,
-            self._receiver.target.quantity + input_quantity)
+            input_quantity)
 
     def handle_once_per_account(self):
         if _exchange_once_per_account(self._offer):
@@ -0,0 +1,49 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+import logging
+
+from google.protobuf.message import Message
+from google.protobuf import text_format
+
+
+def debug(logger, event, **fields):
+    """Logs an event with key=value fields at DEBUG level. Fields, including
+    protobuf messages, are only formatted if the record is emitted.
+
+    Callers on hot paths should check logger.isEnabledFor(logging.DEBUG)
+    first, so that building the fields costs nothing at higher levels.
+    """
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('%s %s', event, LogFields(fields))
+
+
+class LogFields(object):
+
+    def __init__(self, fields):
+        self._fields = fields
+
+    def __str__(self):
+        return ' '.join(
+            '{}={}'.format(key, _format_value(self._fields[key]))
+            for key in sorted(self._fields))
+
+
+def _format_value(value):
+    if isinstance(value, Message):
+        return '{{{}}}'.format(text_format.MessageToString(
+            value, as_one_line=True))
+    return str(value)
@@ -1,7 +1,12 @@
 
+import logging
+
 from sawtooth_sdk.processor.exceptions import InvalidTransaction
 
-from marketplace_processor.protobuf import transfer_pb2
+from marketplace_processor import structured_log
+
+
+LOGGER = logging.getLogger(__name__)
 
 
 def handle_transfer_asset(transfer_asset, header, state):
@@ -28,14 +33,14 @@ def handle_transfer_asset(transfer_asset, header, state):
     transfer = state.get_transfer(identifier=transfer_asset.id,
                                     account = header.signer_public_key)
 
-    print("transfer =======> ",transfer)
+    if LOGGER.isEnabledFor(logging.DEBUG):
+        structured_log.debug(LOGGER, 'handle_transfer_asset',
+                             transfer=transfer)
 
     # check_validity_of_transfer(transfer)
 
     transfer_asset = TeansferAsset(transfer, header, state)
 
-    print("transfer_asset 37 ==================================> " , transfer_asset)
-
     # The asset ids referernce Assets.
     transfer_asset.validate_output_asset_exists()
 
@@ -77,13 +82,17 @@ class TeansferAsset(object):
         source_hldng = state.get_asset(transfer.source)
         target_hldng = state.get_asset(transfer.target)
 
-        resource = state.get_resource(target_hldng.resource)
+        # Kept for its validation behaviour, raising if there is no target
+        state.get_resource(target_hldng.resource)
 
         self._sender_asset = source_hldng
         self._receiver_asset = target_hldng
 
-        print("self._sender_asset ===========> 85 ", self._sender_asset)
-        print("self._receiver_asset ===========> 85 ", self._receiver_asset)
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            structured_log.debug(
+                LOGGER, 'transfer_assets',
+                sender_asset=self._sender_asset,
+                receiver_asset=self._receiver_asset)
 
 
     def validate_output_asset_exists(self):
@@ -113,7 +122,7 @@ class TeansferAsset(object):
                                    self._receiver_asset.resource))
 
     def validate_output_enough(self, output_quantity):
-        if self._accept_offer.source and \
+        if self._transfer.source and \
                 output_quantity > self._sender_asset.quantity:
             raise InvalidTransaction(
                 "Failed to accept offer, needed quantity {}, but only had {} "
@@ -122,12 +131,11 @@ class TeansferAsset(object):
                                self._sender_asset.resource))
 
     def handle_sender_source(self, input_quantity):
-        
-        self._state.change_asset_quantity(
-            self._sender_asset,
-            self._sender_asset.quantity - input_quantity)
+        self._state.adjust_asset_quantity(
+            self._sender_asset.id,
+            -input_quantity)
 
     def handle_receiver_target(self, input_quantity):
-        self._state.change_asset_quantity(
-            self._receiver_asset,
-            self._receiver_asset.quantity + input_quantity)
+        self._state.adjust_asset_quantity(
+            self._receiver_asset.id,
+            input_quantity)
@@ -0,0 +1,112 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+from collections import namedtuple
+import unittest
+from uuid import uuid4
+
+from marketplace_addressing import addresser
+from marketplace_processor.marketplace_state import MarketplaceState
+from marketplace_processor.protobuf import asset_pb2
+
+
+StateEntry = namedtuple('StateEntry', ['address', 'data'])
+
+
+class FakeContext(object):
+    """Holds state in a dict, in place of a validator's context"""
+
+    def __init__(self):
+        self.state = {}
+        self.set_calls = 0
+
+    def get_state(self, addresses, timeout=None):
+        return [StateEntry(a, self.state[a])
+                for a in addresses if a in self.state]
+
+    def set_state(self, entries, timeout=None):
+        self.set_calls += 1
+        self.state.update(entries)
+        return list(entries)
+
+
+def _make_asset(context, identifier, quantity):
+    container = asset_pb2.AssetContainer()
+    container.entries.add(
+        id=identifier, account=uuid4().hex, resource='gold',
+        quantity=quantity)
+    context.state[addresser.make_asset_address(identifier)] = \
+        container.SerializeToString()
+
+
+def _stored_quantity(context, identifier):
+    container = asset_pb2.AssetContainer()
+    container.ParseFromString(
+        context.state[addresser.make_asset_address(identifier)])
+    return next(a.quantity for a in container.entries if a.id == identifier)
+
+
+class MarketplaceStateTest(unittest.TestCase):
+
+    def test_adjustments_to_one_asset_aggregate(self):
+        context = FakeContext()
+        asset_id = uuid4().hex
+        _make_asset(context, asset_id, 10)
+
+        state = MarketplaceState(context, defer_writes=True)
+        state.adjust_asset_quantity(asset_id, -3)
+        state.adjust_asset_quantity(asset_id, 5)
+
+        self.assertEqual(state.get_asset(asset_id).quantity, 12,
+                         "Both adjustments apply to the cached Asset.")
+
+        state.flush()
+        self.assertEqual(_stored_quantity(context, asset_id), 12,
+                         "Both adjustments are written.")
+        self.assertEqual(context.set_calls, 1,
+                         "The asset's container is written once.")
+
+    def test_written_adjustments_aggregate(self):
+        context = FakeContext()
+        asset_id = uuid4().hex
+        _make_asset(context, asset_id, 10)
+
+        state = MarketplaceState(context)
+        state.get_asset(asset_id)
+        state.adjust_asset_quantity(asset_id, -4)
+        state.adjust_asset_quantity(asset_id, -4)
+
+        self.assertEqual(_stored_quantity(context, asset_id), 2,
+                         "The second write includes the first adjustment.")
+
+    def test_adjustments_to_different_legs(self):
+        context = FakeContext()
+        source_id = uuid4().hex
+        target_id = uuid4().hex
+        _make_asset(context, source_id, 10)
+        _make_asset(context, target_id, 0)
+
+        state = MarketplaceState(context, defer_writes=True)
+        # An exchange of one Asset with itself, and with another
+        state.adjust_asset_quantity(source_id, -6)
+        state.adjust_asset_quantity(source_id, 6)
+        state.adjust_asset_quantity(source_id, -2)
+        state.adjust_asset_quantity(target_id, 2)
+        state.flush()
+
+        self.assertEqual(_stored_quantity(context, source_id), 8,
+                         "Every leg on the source Asset is applied.")
+        self.assertEqual(_stored_quantity(context, target_id), 2,
+                         "The target Asset is credited.")
@@ -23,6 +23,7 @@ from sanic import response
 from sawtooth_signing import CryptoFactory
 
 from api.authorization import authorized
+from api.cache import cached
 from api import common
 from api import messaging
 from api.errors import ApiBadRequest
@@ -87,12 +88,15 @@ async def create_account(request):
 @ACCOUNTS_BP.get('accounts')
 async def get_all_accounts(request):
     """Fetches complete details of all Accounts in state"""
+    paging = common.parse_paging(request)
+    stream = common.wants_stream(request)
     account_resources = await accounts_query.fetch_all_account_resources(
-        request.app.config.DB_CONN)
-    return response.json(account_resources)
+        request.app.config.DB_CONN, paging, stream)
+    return common.list_response(account_resources, paging, 'publicKey', stream)
 
 
 @ACCOUNTS_BP.get('accounts/<key>')
+@cached(public_only=True)
 async def get_account(request, key):
     """Fetches the details of particular Account in state"""
     try:
@@ -0,0 +1,180 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import asyncio
+from collections import OrderedDict
+from functools import wraps
+import logging
+
+import rethinkdb as re
+
+from sanic import Blueprint
+from sanic import response
+
+
+CACHE_BP = Blueprint('cache')
+LOGGER = logging.getLogger(__name__)
+
+RETRY_DELAY = 5
+
+r = re.RethinkDB()
+
+
+class ResponseCache(object):
+    """A least recently used cache of serialized JSON response bodies, capped
+    by entry count and total bytes. Everything the API reads changes only
+    when a block is committed, so the whole cache is cleared on each one.
+    The cache serves nothing unless it is active, which it is only while a
+    changefeed is watching for blocks.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._bodies = OrderedDict()
+        self._size = 0
+        self.active = False
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        if not self.active:
+            return None
+        try:
+            body = self._bodies[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._bodies.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def put(self, key, body, generation):
+        """Stores a body, unless the cache was cleared since the generation
+        it was read in, in which case the body may already be stale.
+        """
+        if not self.active or generation != self.generation:
+            return
+        if len(body) > self._max_bytes:
+            return
+
+        old_body = self._bodies.pop(key, None)
+        if old_body is not None:
+            self._size -= len(old_body)
+        self._bodies[key] = body
+        self._size += len(body)
+
+        while (len(self._bodies) > self._max_entries
+               or self._size > self._max_bytes):
+            _, evicted = self._bodies.popitem(last=False)
+            self._size -= len(evicted)
+            self.evictions += 1
+
+    def clear(self):
+        self._bodies.clear()
+        self._size = 0
+        self.generation += 1
+        self.invalidations += 1
+
+    def render(self):
+        """Returns the cache's counters in the Prometheus text format.
+        """
+        metrics = [
+            ('hits_total', 'counter', self.hits,
+             'Responses served from the cache'),
+            ('misses_total', 'counter', self.misses,
+             'Cacheable responses not found in the cache'),
+            ('evictions_total', 'counter', self.evictions,
+             'Responses evicted to stay within the size caps'),
+            ('invalidations_total', 'counter', self.invalidations,
+             'Times the cache was cleared'),
+            ('entries', 'gauge', len(self._bodies),
+             'Responses currently cached'),
+            ('bytes', 'gauge', self._size,
+             'Bytes of responses currently cached')
+        ]
+        lines = []
+        for name, kind, value, description in metrics:
+            name = 'marketplace_rest_cache_' + name
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            lines.append('{} {}'.format(name, value))
+        return '\n'.join(lines) + '\n'
+
+
+async def watch_blocks(cache, conn):
+    """Clears the cache whenever the blocks table changes, reconnecting the
+    changefeed if it fails. The cache is inactive whenever it is not watched.
+    """
+    while True:
+        try:
+            feed = await r.table('blocks').changes().run(conn)
+            cache.clear()
+            cache.active = True
+            LOGGER.info('Watching blocks to invalidate the response cache')
+            while await feed.fetch_next():
+                await feed.next()
+                cache.clear()
+
+        except asyncio.CancelledError:
+            cache.active = False
+            raise
+
+        except Exception as err:  # pylint: disable=broad-except
+            LOGGER.warning('Response cache changefeed failed: %s', err)
+
+        cache.active = False
+        cache.clear()
+        await asyncio.sleep(RETRY_DELAY)
+
+
+def cached(public_only=False):
+    """Serves a GET endpoint's successful responses from the response cache.
+    If public_only, requests with a bearer token bypass the cache, for
+    endpoints whose responses depend on who is asking.
+    """
+    def decorator(func):
+        @wraps(func)
+        async def decorated_function(request, *args, **kwargs):
+            cache = request.app.config.get('RESPONSE_CACHE')
+            if cache is None or (public_only and request.token is not None):
+                return await func(request, *args, **kwargs)
+
+            key = (request.path, request.query_string)
+            body = cache.get(key)
+            if body is not None:
+                return response.raw(body, content_type='application/json')
+
+            generation = cache.generation
+            resp = await func(request, *args, **kwargs)
+            if resp.status == 200:
+                cache.put(key, resp.body, generation)
+            return resp
+        return decorated_function
+    return decorator
+
+
+@CACHE_BP.get('metrics/cache')
+async def get_cache_metrics(request):
+    """Fetches the response cache's hit, miss and size counters"""
+    cache = request.app.config.get('RESPONSE_CACHE')
+    if cache is None:
+        return response.text('')
+    return response.text(
+        cache.render(),
+        content_type='text/plain; version=0.0.4')
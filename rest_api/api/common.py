@@ -13,20 +13,31 @@
 # limitations under the License.
 # ------------------------------------------------------------------------------
 
+import base64
+import json
+
 from Crypto.Cipher import AES
 
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
 
+from sanic import response
+
 from sawtooth_signing import CryptoFactory
 from sawtooth_signing.secp256k1 import Secp256k1PrivateKey
 
 from api.errors import ApiBadRequest
 
 from db import auth_query
+from db.common import Paging
 
 from marketplace_transaction.protobuf import rule_pb2
 
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NDJSON = 'application/x-ndjson'
+
+
 def validate_fields(required_fields, request_json):
     try:
         for field in required_fields:
@@ -96,3 +107,104 @@ def value_to_csv(value):
         return bytes(csv, 'utf-8')
     else:
         raise ApiBadRequest("Rule value must be a JSON array")
+
+
+def parse_paging(request):
+    """Parses the limit, cursor and fields query parameters of a list
+    endpoint. Returns None if none of them were sent. Otherwise the page
+    holds DEFAULT_PAGE_SIZE resources unless a limit is sent, and never
+    more than MAX_PAGE_SIZE.
+    """
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    fields = request.args.get('fields')
+    if limit is None and cursor is None and fields is None:
+        return None
+
+    if limit is None:
+        limit = DEFAULT_PAGE_SIZE
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ApiBadRequest("limit must be an integer")
+        if limit < 1:
+            raise ApiBadRequest("limit must be at least 1")
+        limit = min(limit, MAX_PAGE_SIZE)
+
+    after = None
+    if cursor is not None:
+        after = decode_cursor(cursor)
+
+    if fields is not None:
+        fields = [field for field in fields.split(',') if field]
+
+    return Paging(after, limit, fields)
+
+
+def wants_stream(request):
+    """Returns whether a list endpoint was asked for newline delimited JSON,
+    which is streamed rather than built in memory.
+    """
+    return request.args.get('format') == 'ndjson'
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps([key]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        decoded = base64.urlsafe_b64decode(cursor.encode()).decode()
+        return json.loads(decoded)[0]
+    except (ValueError, TypeError, IndexError, KeyError):
+        raise ApiBadRequest("Invalid cursor")
+
+
+def list_response(resources, paging, key, stream=False):
+    """Builds the response of a list endpoint.
+
+    Args:
+        resources (list or cursor): The query results, a cursor if streaming.
+        paging (Paging): The page requested, or None for every resource.
+        key (str): The field the resources are ordered and paged by.
+        stream (bool): Whether to stream the resources as NDJSON.
+
+    Returns:
+        HTTPResponse: A JSON list of every resource if not paged; if paged, a
+            page of resources with the cursor of the next page, if any.
+    """
+    strip_key = None
+    if paging is not None and paging.fields and key not in paging.fields:
+        strip_key = key
+
+    if stream:
+        return response.stream(
+            lambda resp: _write_ndjson(resp, resources, strip_key),
+            content_type=NDJSON)
+
+    if paging is None:
+        return response.json(resources)
+
+    next_cursor = None
+    if paging.limit is not None and len(resources) == paging.limit:
+        next_cursor = encode_cursor(resources[-1][key])
+    if strip_key is not None:
+        for resource in resources:
+            resource.pop(strip_key, None)
+
+    return response.json({
+        'data': resources,
+        'paging': {'limit': paging.limit, 'next': next_cursor}
+    })
+
+
+async def _write_ndjson(resp, cursor, strip_key):
+    try:
+        while await cursor.fetch_next():
+            resource = await cursor.next()
+            if strip_key is not None:
+                resource.pop(strip_key, None)
+            await resp.write(json.dumps(resource) + '\n')
+    finally:
+        await cursor.close()
@@ -36,6 +36,9 @@ from zmq.asyncio import ZMQEventLoop
 from api.accounts import ACCOUNTS_BP
 from api.resources import RESOURCES_BP
 from api.authorization import AUTH_BP
+from api.cache import CACHE_BP
+from api.cache import ResponseCache
+from api.cache import watch_blocks
 from api.errors import ERRORS_BP
 from api.assets import ASSETS_BP
 from api.offers import OFFERS_BP
@@ -55,7 +58,10 @@ DEFAULT_CONFIG = {
     'KEEP_ALIVE': False,
     'SECRET_KEY': None,
     'AES_KEY': None,
-    'BATCHER_PRIVATE_KEY': None
+    'BATCHER_PRIVATE_KEY': None,
+    'SYNC_TIMEOUT': 5,
+    'RESPONSE_CACHE_ENTRIES': 4096,
+    'RESPONSE_CACHE_BYTES': 64 * 1024 * 1024
 }
 
 r=re.RethinkDB()
@@ -68,6 +74,13 @@ async def open_connections(app):
         port=app.config.DB_PORT,
         db=app.config.DB_NAME)
 
+    if app.config.RESPONSE_CACHE_ENTRIES > 0:
+        app.config.RESPONSE_CACHE = ResponseCache(
+            app.config.RESPONSE_CACHE_ENTRIES,
+            app.config.RESPONSE_CACHE_BYTES)
+        asyncio.ensure_future(
+            watch_blocks(app.config.RESPONSE_CACHE, app.config.DB_CONN))
+
     app.config.VAL_CONN = Connection(app.config.VALIDATOR_URL)
 
     LOGGER.warning('opening validator connection')
@@ -178,6 +191,7 @@ def main():
     app.blueprint(ASSETS_BP)
     app.blueprint(OFFERS_BP)
     app.blueprint(TRANSFER_BP)
+    app.blueprint(CACHE_BP)
 
 
     load_config(app)
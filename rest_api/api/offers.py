@@ -13,19 +13,19 @@
 # limitations under the License.
 # ------------------------------------------------------------------------------
 
-import asyncio
 from uuid import uuid4
 
 from sanic import response
 from sanic import Blueprint
 
 from api.authorization import authorized
+from api.cache import cached
 from api import common
 from api import messaging
 from api.errors import ApiBadRequest
 
 from db import offers_query
-from db.common import fetch_assets
+from db.common import wait_for_assets
 
 from marketplace_transaction import transaction_creation
 
@@ -42,11 +42,11 @@ async def create_offer(request):
 
     signer = await common.get_signer(request)
 
-    await asyncio.sleep(2.0)  # Mitigate race condition
     offer = _create_offer_dict(request.json, signer.get_public_key().as_hex())
 
+    # Assets created just before the offer may not be synced yet
     offer_assets = await _create_assets_dict(
-        request.app.config.DB_CONN, offer)
+        request.app.config.DB_CONN, offer, request.app.config.SYNC_TIMEOUT)
 
     source, target = _create_marketplace_assets(offer, offer_assets)
 
@@ -80,12 +80,17 @@ async def get_all_offers(request):
     query_params = {
         k: request.args[k][0] for k in keys if request.args.get(k) is not None
     }
+    if request.args.get('owner') is not None:
+        query_params['owners'] = request.args['owner'][0]
+    paging = common.parse_paging(request)
+    stream = common.wants_stream(request)
     offer_resources = await offers_query.fetch_all_offer_resources(
-        request.app.config.DB_CONN, query_params)
-    return response.json(offer_resources)
+        request.app.config.DB_CONN, query_params, paging, stream)
+    return common.list_response(offer_resources, paging, 'id', stream)
 
 
 @OFFERS_BP.get('offers/<offer_id>')
+@cached()
 async def get_offer(request, offer_id):
     """Fetches the details of particular Offer in state"""
     offer_resource = await offers_query.fetch_offer_resource(
@@ -103,8 +108,9 @@ async def accept_offer(request, offer_id):
     offer = await offers_query.fetch_offer_resource(
         request.app.config.DB_CONN, offer_id)
 
+    # The offer exists, so its assets have been synced
     offer_assets = await _create_assets_dict(
-        request.app.config.DB_CONN, offer)
+        request.app.config.DB_CONN, offer, timeout=0)
 
     offerer, receiver = _create_offer_participants(
         request.json, offer, offer_assets)
@@ -188,11 +194,11 @@ def _create_offer_participants(body, offer, offer_assets):
     return (offerer, receiver)
 
 
-async def _create_assets_dict(conn, asset_ids):
+async def _create_assets_dict(conn, asset_ids, timeout=0):
     keys = ['source', 'target']
-    assets = await fetch_assets([
+    assets = await wait_for_assets(conn, [
         asset_ids.get(k) for k in keys if asset_ids.get(k) is not None
-    ]).run(conn)
+    ], timeout)
 
     assets_dict = {
         k: h for h in assets for k in keys if asset_ids.get(k) == h['id']
@@ -19,6 +19,7 @@ from sanic import Blueprint
 from sanic import response
 
 from api.authorization import authorized
+from api.cache import cached
 from api import common
 from api import messaging
 
@@ -63,12 +64,15 @@ async def create_resource(request):
 @RESOURCES_BP.get('resources')
 async def get_all_resources(request):
     """Fetches complete details of all Resources in state"""
+    paging = common.parse_paging(request)
+    stream = common.wants_stream(request)
     resource_resources = await resources_query.fetch_all_resource_resources(
-        request.app.config.DB_CONN)
-    return response.json(resource_resources)
+        request.app.config.DB_CONN, paging, stream)
+    return common.list_response(resource_resources, paging, 'name', stream)
 
 
 @RESOURCES_BP.get('resources/<name>')
+@cached()
 async def get_resource(request, name):
     """Fetches the details of particular Resource in state"""
     decoded_name = unquote(name)
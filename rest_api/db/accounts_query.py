@@ -19,35 +19,42 @@ from rethinkdb.errors import ReqlNonExistenceError
 from api.errors import ApiBadRequest
 
 from db.common import fetch_assets
-from db.common import fetch_latest_block_num
+from db.common import fetch_history_block_num
+from db.common import fetch_versions
+from db.common import project
+from db.common import run_listing
+from db.common import select_current
 
 r=re.RethinkDB()
 
 
-async def fetch_all_account_resources(conn):
-    return await r.table('accounts')\
-        .filter((fetch_latest_block_num() >= r.row['start_block_num'])
-                & (fetch_latest_block_num() < r.row['end_block_num']))\
+async def fetch_all_account_resources(conn, paging=None, stream=False):
+    # Where assets are read from is looked up once, not once per account
+    query = fetch_history_block_num('assets').do(
+        lambda assets_block_num: select_current(
+            'accounts', 'public_key', paging)
         .map(lambda account: account.merge(
-            {'publicKey': account['public_key']}))\
+            {'publicKey': account['public_key']}))
         .map(lambda account: account.merge(
-            {'assets': fetch_assets(account['assets'])}))\
+            {'assets': fetch_assets(account['assets'], assets_block_num)}))
         .map(lambda account: (account['label'] == "").branch(
-            account.without('label'), account))\
+            account.without('label'), account))
         .map(lambda account: (account['description'] == "").branch(
-            account.without('description'), account))\
+            account.without('description'), account))
         .without('public_key', 'delta_id',
-                 'start_block_num', 'end_block_num')\
-        .coerce_to('array').run(conn)
+                 'start_block_num', 'end_block_num'))
+    return await run_listing(
+        conn, project(query, paging, 'publicKey'), stream)
 
 
 async def fetch_account_resource(conn, public_key, auth_key):
     try:
-        return await r.table('accounts')\
-            .get_all(public_key, index='public_key')\
+        return await fetch_versions('accounts', [public_key], 'public_key')\
             .max('start_block_num')\
-            .merge({'publicKey': r.row['public_key']})\
-            .merge({'assets': fetch_assets(r.row['assets'])})\
+            .do(lambda account: account.merge(
+                {'publicKey': account['public_key']}))\
+            .do(lambda account: account.merge(
+                {'assets': fetch_assets(account['assets'])}))\
             .do(lambda account: (r.expr(auth_key).eq(public_key)).branch(
                 account.merge(_fetch_email(public_key)), account))\
             .do(lambda account: (account['label'] == "").branch(
@@ -13,6 +13,10 @@
 # limitations under the License.
 # ------------------------------------------------------------------------------
 
+import asyncio
+from collections import namedtuple
+import sys
+
 import rethinkdb as re
 from rethinkdb.errors import ReqlNonExistenceError
 
@@ -23,6 +27,10 @@ VAL_TYPE_INT = r.expr([
     "REQUIRE_SOURCE_QUANTITIES", "REQUIRE_TARGET_QUANTITIES"
 ])
 
+# A page of a list endpoint: resources with keys after `after`, at most
+# `limit` of them, each projected to `fields`. Any of these may be None.
+Paging = namedtuple('Paging', ['after', 'limit', 'fields'])
+
 
 def fetch_latest_block_num():
     try:
@@ -33,12 +41,193 @@ def fetch_latest_block_num():
         raise ApiInternalError('No block data found in state')
 
 
-def fetch_assets(asset_ids):
-    return r.table('assets')\
-        .get_all(r.args(asset_ids), index='id')\
-        .filter(lambda asset: (
-            fetch_latest_block_num() >= asset['start_block_num'])
-                & (fetch_latest_block_num() < asset['end_block_num']))\
+def fetch_current(table_name, keys=None, index=None):
+    """Selects the current version of every resource in a table, or of those
+    with any of the given keys. Reads the table's current table if ledger sync
+    maintains one, or else its history, as of the latest block.
+    """
+    # Keys may use r.row, so are bound before any nested function
+    return r.do(
+        keys, fetch_history_block_num(table_name),
+        lambda bound_keys, block_num: read_current(
+            table_name, block_num, None if keys is None else bound_keys,
+            index))
+
+
+def fetch_history_block_num(table_name):
+    """Returns None if a table has a current table, or else the latest block
+    number, as of which its history must be read. Bind it once, with do, to
+    pass to read_current for every row of a query.
+    """
+    current_table = '{}_current'.format(table_name)
+    return r.table_list().contains(current_table).branch(
+        None, fetch_latest_block_num())
+
+
+def read_current(table_name, block_num, keys=None, index=None):
+    """Like fetch_current, given the result of fetch_history_block_num.
+    """
+    current_table = '{}_current'.format(table_name)
+    if keys is None:
+        current = r.table(current_table)
+    else:
+        current = r.table(current_table).get_all(r.args(keys))
+    return r.branch(
+        r.expr(block_num).eq(None),
+        current,
+        _fetch_at_block(table_name, block_num, keys, index))
+
+
+def _fetch_at_block(table_name, block_num, keys, index):
+    # The latest block is bound once, rather than looked up for every row
+    if keys is None:
+        return r.branch(
+            has_ready_index(table_name, 'end_block_num'),
+            r.table(table_name)
+            .between(block_num + 1, r.maxval, index='end_block_num')
+            .filter(lambda resource: (
+                resource['start_block_num'] <= block_num)),
+            r.table(table_name)
+            .filter(lambda resource: (
+                block_num >= resource['start_block_num'])
+                & (block_num < resource['end_block_num'])))
+
+    return r.table(table_name)\
+        .get_all(r.args(keys), index=index)\
+        .filter(lambda resource: (block_num >= resource['start_block_num'])
+                & (block_num < resource['end_block_num']))
+
+
+def has_ready_index(table_name, index):
+    """Returns whether a table has a secondary index which has finished
+    building, as queries on an index still building fail.
+    """
+    return r.table(table_name).index_status()\
+        .filter({'index': index, 'ready': True})\
+        .is_empty().not_()
+
+
+def fetch_current_by_index(table_name, index, value, predicate):
+    """Selects the current versions of resources whose index matches value,
+    through the current table's index, or the versioned table's compound
+    [index, end_block_num] index. If neither exists, filters every current
+    resource with predicate instead.
+    """
+    current_table = '{}_current'.format(table_name)
+    compound_index = '{}_end_block_num'.format(index)
+    return r.branch(
+        r.table_list().contains(current_table)
+        & has_ready_index(current_table, index),
+        r.table(current_table).get_all(value, index=index),
+        has_ready_index(table_name, compound_index),
+        r.table(table_name).get_all(
+            [value, sys.maxsize], index=compound_index),
+        fetch_current(table_name).filter(predicate))
+
+
+def select_current(table_name, key, paging=None, filters=None, index=None,
+                   value=None):
+    """Selects the current version of every resource in a table matching
+    filters. With paging, resources are ordered by their key, the entity id
+    which is both the primary key of the current table and a secondary index
+    of the versioned one, and only the requested page is read. If an index
+    and value are given, only resources whose index matches value are read,
+    as by fetch_current_by_index, and filters must include that match.
+    """
+    if index is not None:
+        if paging is None:
+            query = fetch_current_by_index(table_name, index, value, filters)
+        else:
+            query = _fetch_current_by_index_in_order(
+                table_name, key, index, value, paging.after)
+    elif paging is None:
+        query = fetch_current(table_name)
+    else:
+        query = _fetch_current_in_order(table_name, key, paging.after)
+
+    if filters:
+        query = query.filter(filters)
+    if paging is not None and paging.limit is not None:
+        query = query.limit(paging.limit)
+    return query
+
+
+def _fetch_current_in_order(table_name, key, after):
+    current_table = '{}_current'.format(table_name)
+    lower, left_bound = r.minval, 'closed'
+    if after is not None:
+        lower, left_bound = after, 'open'
+
+    return r.table_list().contains(current_table).branch(
+        r.table(current_table)
+        .between(lower, r.maxval, left_bound=left_bound)
+        .order_by(index=key),
+        fetch_latest_block_num().do(
+            lambda block_num: r.table(table_name)
+            .between(lower, r.maxval, index=key, left_bound=left_bound)
+            .order_by(index=key)
+            .filter(lambda resource: (
+                block_num >= resource['start_block_num'])
+                    & (block_num < resource['end_block_num']))))
+
+
+def _fetch_current_by_index_in_order(table_name, key, index, value, after):
+    # Reads the matches from the current table's [index, key] index, if it
+    # has one, or else scans every current resource in key order
+    current_table = '{}_current'.format(table_name)
+    ordered_index = '{}_{}'.format(index, key)
+    lower, left_bound = r.minval, 'closed'
+    if after is not None:
+        lower, left_bound = after, 'open'
+
+    return r.branch(
+        r.table_list().contains(current_table)
+        & has_ready_index(current_table, ordered_index),
+        r.table(current_table)
+        .between([value, lower], [value, r.maxval],
+                 index=ordered_index, left_bound=left_bound)
+        .order_by(index=ordered_index),
+        _fetch_current_in_order(table_name, key, after))
+
+
+def project(query, paging, key):
+    """Plucks the requested fields from each resource, keeping its key so
+    the next page can be found.
+    """
+    if paging is None or not paging.fields:
+        return query
+    return query.pluck(r.args(list(set(paging.fields) | {key})))
+
+
+async def run_listing(conn, query, stream=False):
+    """Runs a list query, returning a cursor to stream the results from, or
+    else the results as a list.
+    """
+    if stream:
+        return await query.run(conn)
+    return await query.coerce_to('array').run(conn)
+
+
+def fetch_versions(table_name, keys, index):
+    """Selects the resources in a table with any of the given keys. Reads
+    only their current versions if the table has a current table, or else
+    every version, to be narrowed down by the caller.
+    """
+    current_table = '{}_current'.format(table_name)
+    return r.table_list().contains(current_table).branch(
+        r.table(current_table).get_all(r.args(keys)),
+        r.table(table_name).get_all(r.args(keys), index=index))
+
+
+def fetch_assets(asset_ids, block_num=None):
+    """Selects the current versions of assets. For many lists of assets in one
+    query, pass the result of fetch_history_block_num('assets'), bound once.
+    """
+    if block_num is None:
+        assets = fetch_current('assets', asset_ids, 'id')
+    else:
+        assets = read_current('assets', block_num, asset_ids, 'id')
+    return assets\
         .map(lambda asset: (asset['label'] == "").branch(
             asset.without('label'), asset))\
         .map(lambda asset: (asset['description'] == "").branch(
@@ -47,6 +236,46 @@ def fetch_assets(asset_ids):
         .coerce_to('array')
 
 
+async def wait_for_assets(conn, asset_ids, timeout):
+    """Fetches assets, waiting for any not yet synced from the ledger. If
+    some are missing, the fetch is retried each time a block is committed,
+    until all are found or the timeout passes.
+
+    Args:
+        conn: The database connection.
+        asset_ids (list of str): The ids of the assets to fetch.
+        timeout (float): The most seconds to wait for missing assets.
+
+    Returns:
+        list of dict: The assets found, which may not be all of them.
+    """
+    assets = await fetch_assets(asset_ids).run(conn)
+    if _has_assets(assets, asset_ids) or timeout <= 0:
+        return assets
+
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + timeout
+    feed = await r.table('blocks').changes().run(conn)
+    try:
+        while True:
+            # Checked after the feed opens, so no commit can be missed
+            assets = await fetch_assets(asset_ids).run(conn)
+            remaining = deadline - loop.time()
+            if _has_assets(assets, asset_ids) or remaining <= 0:
+                return assets
+            try:
+                await asyncio.wait_for(feed.fetch_next(), remaining)
+                await feed.next()
+            except asyncio.TimeoutError:
+                return assets
+    finally:
+        await feed.close()
+
+
+def _has_assets(assets, asset_ids):
+    return set(asset_ids) <= {asset['id'] for asset in assets}
+
+
 def parse_rules(rules):
     return r.expr(
         {
@@ -18,17 +18,27 @@ from rethinkdb.errors import ReqlNonExistenceError
 
 from api.errors import ApiBadRequest
 
-from db.common import fetch_latest_block_num
+from db.common import fetch_versions
 from db.common import parse_rules
+from db.common import project
+from db.common import run_listing
+from db.common import select_current
 
 
 r=re.RethinkDB()
 
-async def fetch_all_offer_resources(conn, query_params):
-    return await r.table('offers')\
-        .filter((fetch_latest_block_num() >= r.row['start_block_num'])
-                & (fetch_latest_block_num() < r.row['end_block_num']))\
-        .filter(query_params)\
+# Filters with an index, from most to least selective
+FILTER_INDEXES = ['source', 'target', 'owners', 'status']
+
+
+async def fetch_all_offer_resources(conn, query_params, paging=None,
+                                    stream=False):
+    index = next((i for i in FILTER_INDEXES
+                  if query_params.get(i) is not None), None)
+
+    query = select_current(
+        'offers', 'id', paging, _match(query_params), index,
+        query_params.get(index))\
         .map(lambda offer: (offer['label'] == "").branch(
             offer.without('label'), offer))\
         .map(lambda offer: (offer['description'] == "").branch(
@@ -43,14 +53,25 @@ async def fetch_all_offer_resources(conn, query_params):
         .map(lambda offer: (offer['rules'] == []).branch(
             offer, offer.merge(parse_rules(offer['rules']))))\
         .without('delta_id', 'start_block_num', 'end_block_num',
-                 'source_quantity', 'target_quantity')\
-        .coerce_to('array').run(conn)
+                 'source_quantity', 'target_quantity')
+    return await run_listing(conn, project(query, paging, 'id'), stream)
+
+
+def _match(query_params):
+    if not query_params:
+        return None
+
+    def _matches(offer):
+        return r.and_(*[
+            offer[k].contains(v) if k == 'owners' else offer[k] == v
+            for k, v in query_params.items()])
+
+    return _matches
 
 
 async def fetch_offer_resource(conn, offer_id):
     try:
-        return await r.table('offers')\
-            .get_all(offer_id, index='id')\
+        return await fetch_versions('offers', [offer_id], 'id')\
             .max('start_block_num')\
             .do(lambda offer: (offer['label'] == "").branch(
                 offer.without('label'), offer))\
@@ -18,28 +18,28 @@ from rethinkdb.errors import ReqlNonExistenceError
 
 from api.errors import ApiBadRequest
 
-from db.common import fetch_latest_block_num
+from db.common import fetch_versions
 from db.common import parse_rules
+from db.common import project
+from db.common import run_listing
+from db.common import select_current
 
 
 r=re.RethinkDB()
 
-async def fetch_all_resource_resources(conn):
-    return await r.table('resources')\
-        .filter((fetch_latest_block_num() >= r.row['start_block_num'])
-                & (fetch_latest_block_num() < r.row['end_block_num']))\
+async def fetch_all_resource_resources(conn, paging=None, stream=False):
+    query = select_current('resources', 'name', paging)\
         .map(lambda resource: (resource['description'] == "").branch(
             resource.without('description'), resource))\
         .map(lambda resource: (resource['rules'] == []).branch(
             resource, resource.merge(parse_rules(resource['rules']))))\
-        .without('start_block_num', 'end_block_num', 'delta_id')\
-        .coerce_to('array').run(conn)
+        .without('start_block_num', 'end_block_num', 'delta_id')
+    return await run_listing(conn, project(query, paging, 'name'), stream)
 
 
 async def fetch_resource_resource(conn, name):
     try:
-        return await r.table('resources')\
-            .get_all(name, index='name')\
+        return await fetch_versions('resources', [name], 'name')\
             .max('start_block_num')\
             .do(lambda resource: (resource['description'] == "").branch(
                 resource.without('description'), resource))\